@@ -10,9 +10,9 @@ sudo docker build -t star-burger_frontend -f dockerfiles/Dockerfile.frontend .
 sudo docker run --rm -v $(pwd)/bundles:/app/bundles star-burger_frontend
 
 echo "Setting up backend"
-sudo docker-compose -f docker-compose.prod.yml up -d
+sudo docker-compose -f docker-compose.prod.yml up -d --build
 sudo docker exec -t django python manage.py migrate
-sudo docker cp django:/app/staticfiles .
+sudo docker exec -t django python manage.py load_banners
 
 echo "Clearing unused docker items"
 sudo docker system prune -f
@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.conf.global_settings import ALLOWED_HOSTS
+from django.core.paginator import Paginator
+from django.db import connections
 from django.shortcuts import redirect, reverse
-from django.templatetags.static import static
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from .models import Order, OrderPosition, Product
+from .images import get_image_url
+from .models import Banner, Order, OrderPosition, Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
@@ -84,7 +87,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
 
     class Media:
-        css = {"all": (static("admin/foodcartapp.css"))}
+        css = {"all": ("admin/foodcartapp.css",)}
 
     def get_image_preview(self, obj):
         if not obj.image:
@@ -102,7 +105,29 @@ class ProductAdmin(admin.ModelAdmin):
         return format_html(
             '<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>',
             edit_url=edit_url,
-            src=obj.image.url,
+            src=get_image_url(obj, width=100),
+        )
+
+    get_image_list_preview.short_description = 'превью'
+
+
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'get_image_list_preview',
+        'title',
+        'position',
+        'active_from',
+        'active_until',
+    ]
+    list_display_links = ['title']
+    list_editable = ['position']
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html(
+            '<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url
         )
 
     get_image_list_preview.short_description = 'превью'
@@ -113,19 +138,81 @@ class ProductAdmin(admin.ModelAdmin):
     pass
 
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator reading number of rows of a big table from statistics.
+
+    Counting all rows of a big table in PostgreSQL means a full scan, so for
+    unfiltered lists the planner estimate from pg_class is used instead.
+    Filtered lists, small tables and other databases are counted exactly.
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return super().count
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        if not row or row[0] < self.estimate_threshold:
+            return super().count
+        return int(row[0])
+
+
 class OrderPositionInline(admin.TabularInline):
     model = OrderPosition
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'product':
+            # Choices are shared by all rows to fetch products once
+            if not hasattr(request, 'product_choices'):
+                request.product_choices = list(formfield.choices)
+            formfield.choices = request.product_choices
+        return formfield
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'contact_phone', 'status', 'restaurant')
+    list_display = (
+        '__str__',
+        'contact_phone',
+        'status',
+        'restaurant',
+        'get_total_price',
+    )
+    list_select_related = ['restaurant']
+    date_hierarchy = 'registered_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     inlines = [
         OrderPositionInline,
     ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total_prices()
+
+    def get_total_price(self, obj):
+        return obj.total_price
+
+    get_total_price.short_description = 'сумма'
+    get_total_price.admin_order_field = 'total_price'
+
     def response_post_save_change(self, request, obj):
         res = super().response_post_save_change(request, obj)
         next = request.GET.get('redirect_to', None)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+
+class VersionedCache:
+    """Base of caches kept in process memory and shared version.
+
+    The version is stored in the Django cache, so invalidation made by one
+    process forces every process to rebuild its copy.
+
+    Args:
+        name: unique name of the cached value
+    """
+
+    def __init__(self, name):
+        self.version_key = f'payload-version:{name}'
+        self.lock = threading.Lock()
+
+    def get_version(self):
+        return cache.get_or_set(
+            self.version_key, lambda: uuid.uuid4().hex, timeout=None
+        )
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+
+
+class CachedValue(VersionedCache):
+    """Python object built once per version and kept in process memory."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.version = None
+        self.value = None
+
+    def get(self, build):
+        """Return cached value, building it if it is outdated.
+
+        Args:
+            build: function returning the value
+        """
+
+        version = self.get_version()
+        with self.lock:
+            if self.version == version:
+                return self.value
+
+        value = build()
+        with self.lock:
+            self.version = version
+            self.value = value
+        return value
+
+
+class CachedPayload(VersionedCache):
+    """JSON payload encoded once and kept in a process-local cache.
+
+    Args:
+        name: unique name of the payload
+        max_entries: maximal number of variants of the payload (e.g. for
+            different query parameters) kept in memory, least recently used
+            variants are evicted first
+    """
+
+    def __init__(self, name, max_entries=64):
+        super().__init__(name)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, build, variant=None, get_expires_at=None):
+        """Return ETag and encoded payload, building it if necessary.
+
+        Args:
+            build: function returning data to encode to JSON
+            variant: hashable key of the payload variant
+            get_expires_at: optional function called together with build,
+                returning time when the payload gets outdated by itself or
+                None if it doesn't
+
+        Returns:
+            tuple of ETag and encoded JSON bytes
+        """
+
+        version = self.get_version()
+        key = (version, variant)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+        if entry:
+            etag, body, expires_at = entry
+            if expires_at is None or timezone.now() < expires_at:
+                return etag, body
+
+        expires_at = get_expires_at() if get_expires_at else None
+        body = json.dumps(
+            build(),
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+            separators=(',', ':'),
+        ).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+
+        with self.lock:
+            for stale_key in [
+                stale_key
+                for stale_key in self.entries
+                if stale_key[0] != version
+            ]:
+                del self.entries[stale_key]
+
+            self.entries[key] = (etag, body, expires_at)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return etag, body
+
+    def get_response(self, request, build, variant=None, get_expires_at=None):
+        """Return response with the payload or 304 if client has it already.
+
+        Args:
+            request: HTTP request
+            build: function returning data to encode to JSON
+            variant: hashable key of the payload variant
+            get_expires_at: optional function returning time when the
+                payload gets outdated by itself
+        """
+
+        etag, body = self.get(build, variant, get_expires_at)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+products_payload = CachedPayload('products')
+banners_payload = CachedPayload('banners')
+availability_matrix = CachedValue('availability-matrix')
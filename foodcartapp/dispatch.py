@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Order, Restaurant
+
+
+def assign_restaurants(candidates_by_order, capacities):
+    """Assign restaurants to a batch of orders respecting their capacities.
+
+    Greedy min-cost assignment: all (order, restaurant) pairs of the batch
+    are taken from the shortest to the longest distance, and a pair is
+    accepted while the order is unassigned and the restaurant has free
+    capacity. Unlike assigning the nearest restaurant order by order, this
+    does not let early orders take a restaurant which is the only close
+    one for later orders.
+
+    Args:
+        candidates_by_order: dictionary mapping orders to their restaurant
+            candidates
+        capacities: dictionary mapping restaurants to number of orders they
+            can take, restaurants missing here can't take orders
+
+    Returns:
+        dictionary mapping orders to assigned restaurants
+    """
+
+    capacities = dict(capacities)
+
+    pairs = sorted(
+        (
+            (candidate.distance, order_number, candidate.restaurant)
+            for order_number, candidates in enumerate(
+                candidates_by_order.values()
+            )
+            for candidate in candidates
+            if candidate.distance is not None
+        ),
+        key=lambda pair: (pair[0], pair[1]),
+    )
+
+    orders = list(candidates_by_order)
+    assigned_restaurants = {}
+    for _, order_number, restaurant in pairs:
+        order = orders[order_number]
+        if order in assigned_restaurants:
+            continue
+        if capacities.get(restaurant, 0) <= 0:
+            continue
+
+        assigned_restaurants[order] = restaurant
+        capacities[restaurant] -= 1
+
+    return assigned_restaurants
+
+
+def get_restaurants_capacities(max_open_orders):
+    """Return number of orders every restaurant can take yet.
+
+    Unprocessed orders which are assigned to a restaurant and not delivered
+    yet are considered open. Processed orders are left out, whether their
+    delivery is registered or not.
+    """
+
+    restaurants = Restaurant.objects.annotate(
+        open_orders=Count(
+            'orders',
+            filter=Q(
+                orders__status=Order.OrderStatus.UNPROCESSED,
+                orders__delivered_at__isnull=True,
+            ),
+        )
+    )
+    return {
+        restaurant: max_open_orders - restaurant.open_orders
+        for restaurant in restaurants
+        if restaurant.open_orders < max_open_orders
+    }
+
+
+def dispatch_orders(batch_size, max_open_orders, dry_run=False):
+    """Assign restaurants to unprocessed orders without one, oldest first.
+
+    The queue is walked in batches by (registered_at, pk) until its end or
+    until no restaurant has free capacity, so orders which can't be
+    assigned yet do not hold back the ones behind them.
+
+    Args:
+        batch_size: maximal number of orders to dispatch at once
+        max_open_orders: maximal number of open orders per restaurant
+        dry_run: calculate assignment without saving it
+
+    Returns:
+        dictionary mapping orders to assigned restaurants
+    """
+
+    capacities = get_restaurants_capacities(max_open_orders)
+
+    assigned_restaurants = {}
+    last_order = None
+    while any(capacity > 0 for capacity in capacities.values()):
+        orders = (
+            Order.objects.unprocessed()
+            .filter(restaurant__isnull=True)
+            .order_by('registered_at', 'pk')
+        )
+        if last_order:
+            orders = orders.filter(
+                Q(registered_at__gt=last_order.registered_at)
+                | Q(
+                    registered_at=last_order.registered_at,
+                    pk__gt=last_order.pk,
+                )
+            )
+        orders = orders[:batch_size]
+
+        batch_restaurants = dispatch_batch(
+            orders.add_restaurant_candidates(),
+            capacities,
+            dry_run,
+        )
+        assigned_restaurants.update(batch_restaurants)
+        for restaurant in batch_restaurants.values():
+            capacities[restaurant] -= 1
+
+        if len(orders) < batch_size:
+            break
+        last_order = list(orders)[-1]
+
+    return assigned_restaurants
+
+
+def dispatch_batch(orders, capacities, dry_run):
+    """Assign restaurants to orders with candidates and save assignment.
+
+    Returns:
+        dictionary mapping orders to assigned restaurants
+    """
+
+    assigned_restaurants = assign_restaurants(
+        {order: order.restaurant_candidates for order in orders},
+        capacities,
+    )
+    if dry_run:
+        return assigned_restaurants
+
+    orders_by_restaurant = defaultdict(list)
+    for order, restaurant in assigned_restaurants.items():
+        orders_by_restaurant[restaurant].append(order.pk)
+
+    now = timezone.now()
+    with transaction.atomic():
+        for restaurant, order_ids in orders_by_restaurant.items():
+            Order.objects.filter(
+                pk__in=order_ids,
+                restaurant__isnull=True,
+            ).update(restaurant=restaurant, updated_at=now)
+
+    return assigned_restaurants
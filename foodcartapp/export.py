@@ -0,0 +1,163 @@
+import csv
+import json
+from datetime import datetime
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import OrderPosition
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_FIELDS = [
+    'id',
+    'registered_at',
+    'status',
+    'payment_method',
+    'restaurant',
+    'first_name',
+    'last_name',
+    'contact_phone',
+    'address',
+    'comment',
+    'called_at',
+    'delivered_at',
+    'total_price',
+]
+
+POSITION_FIELDS = ['product', 'product__name', 'quantity', 'price']
+
+CSV_HEADER = ORDER_FIELDS + [
+    'product',
+    'product_name',
+    'quantity',
+    'price',
+]
+
+
+def iterate_orders_with_positions(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield orders together with their positions.
+
+    Orders and positions are read with two server-side cursors ordered by
+    order id and merged on the fly, so memory usage doesn't depend on the
+    number of exported orders.
+
+    Args:
+        orders: queryset of orders to export
+        chunk_size: number of rows fetched from the database at once
+
+    Yields:
+        (order, positions) pairs of dictionaries
+    """
+
+    orders_values = (
+        orders.with_total_prices()
+        .order_by('pk')
+        .values(*ORDER_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    positions_values = (
+        OrderPosition.objects.filter(order__in=orders.values('pk'))
+        .order_by('order', 'pk')
+        .values('order', *POSITION_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    positions_by_order = groupby(
+        positions_values, key=lambda position: position['order']
+    )
+
+    order_id, positions = next(positions_by_order, (None, []))
+    for order in orders_values:
+        order['contact_phone'] = str(order['contact_phone'])
+
+        if order_id != order['id']:
+            yield order, []
+            continue
+
+        yield order, [
+            {
+                'product': position['product'],
+                'product_name': position['product__name'],
+                'quantity': position['quantity'],
+                'price': position['price'],
+            }
+            for position in positions
+        ]
+        order_id, positions = next(positions_by_order, (None, []))
+
+
+def get_day_start(day):
+    """Return aware datetime of the day start in the current time zone."""
+
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+class Echo:
+    """File-like object returning written value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(orders_with_positions):
+    """Yield CSV lines, one per order position.
+
+    Order columns are repeated in every line of the order. Order without
+    positions gets one line with empty position columns.
+    """
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    for order, positions in orders_with_positions:
+        order_row = [order[field] for field in ORDER_FIELDS]
+        if not positions:
+            yield writer.writerow(order_row + [''] * len(POSITION_FIELDS))
+        for position in positions:
+            yield writer.writerow(
+                order_row
+                + [
+                    position['product'],
+                    position['product_name'],
+                    position['quantity'],
+                    position['price'],
+                ]
+            )
+
+
+def export_ndjson(orders_with_positions):
+    """Yield JSON lines, one per order with nested positions."""
+
+    for order, positions in orders_with_positions:
+        yield json.dumps(
+            {**order, 'positions': positions},
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+        ) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', export_csv),
+    'ndjson': ('application/x-ndjson', export_ndjson),
+}
+
+
+def export_orders(orders, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Serialize orders with positions and total prices lazily.
+
+    Args:
+        orders: queryset of orders to export
+        export_format: 'csv' or 'ndjson'
+        chunk_size: number of rows fetched from the database at once
+
+    Returns:
+        content type and iterator over chunks of text
+    """
+
+    content_type, export = EXPORT_FORMATS[export_format]
+    return content_type, export(
+        iterate_orders_with_positions(orders, chunk_size=chunk_size)
+    )
+
@@ -0,0 +1,233 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Bounds number of threads of the process held by open feed connections
+feed_connections = threading.BoundedSemaphore(
+    settings.ORDERS_FEED_MAX_CONNECTIONS
+)
+
+
+class OrdersCursor:
+    """Position in the stream of orders changes.
+
+    `updated_at` is set before a transaction commits, so a change may get
+    visible later than changes with greater timestamps. The cursor therefore
+    re-reads changes made after `since`, which lags ORDERS_FEED_OVERLAP
+    seconds behind the time of the last read, and skips the ones in `seen`.
+
+    Args:
+        since: time changes are re-read from
+        seen: dictionary mapping ids of orders changed after `since` to
+            their updated_at
+    """
+
+    def __init__(self, since, seen=None):
+        self.since = since
+        self.seen = dict(seen or {})
+        self.trim()
+
+    def trim(self):
+        """Forget changes older than `since`.
+
+        If more than ORDERS_FEED_BATCH_SIZE changes are left, `since` is
+        moved forward, so the cursor stays short enough for a URL.
+        """
+
+        seen_times = sorted(
+            updated_at
+            for updated_at in self.seen.values()
+            if updated_at >= self.since
+        )
+        if len(seen_times) > settings.ORDERS_FEED_BATCH_SIZE:
+            self.since = seen_times[-settings.ORDERS_FEED_BATCH_SIZE]
+        self.seen = {
+            pk: updated_at
+            for pk, updated_at in self.seen.items()
+            if updated_at >= self.since
+        }
+
+    def add(self, order):
+        self.seen[order.pk] = order.updated_at
+
+    def encode(self):
+        since = to_microseconds(self.since)
+        return '.'.join(
+            [str(since)]
+            + [
+                f'{pk}:{to_microseconds(updated_at) - since}'
+                for pk, updated_at in sorted(self.seen.items())
+            ]
+        )
+
+    @classmethod
+    def decode(cls, cursor):
+        """Return cursor encoded into a string or None if it is invalid."""
+
+        try:
+            since, *seen = cursor.split('.')
+            since = from_microseconds(int(since))
+            seen = {
+                int(pk): since + timedelta(microseconds=int(offset))
+                for pk, offset in (change.split(':') for change in seen)
+            }
+        except (AttributeError, OverflowError, ValueError):
+            return None
+        return cls(since, seen)
+
+    @classmethod
+    def current(cls):
+        """Return cursor of changes already visible to the caller."""
+
+        since = timezone.now() - timedelta(
+            seconds=settings.ORDERS_FEED_OVERLAP
+        )
+        return cls(
+            since,
+            Order.objects.filter(updated_at__gte=since).values_list(
+                'pk', 'updated_at'
+            ),
+        )
+
+
+def to_microseconds(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_microseconds(microseconds):
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+def get_orders_changes(cursor):
+    """Return orders changed after the cursor position.
+
+    The cursor is moved past the returned changes.
+
+    Args:
+        cursor: position of the last seen change
+
+    Returns:
+        list of changed orders ordered by time of change
+    """
+
+    read_at = timezone.now()
+    orders = Order.objects.with_total_prices().filter(
+        updated_at__gte=cursor.since
+    )
+    if cursor.seen:
+        orders = orders.exclude(
+            reduce(
+                or_,
+                (
+                    Q(pk=pk, updated_at=updated_at)
+                    for pk, updated_at in cursor.seen.items()
+                ),
+            )
+        )
+    orders = list(
+        orders.order_by('updated_at', 'pk')[: settings.ORDERS_FEED_BATCH_SIZE]
+    )
+
+    for order in orders:
+        cursor.add(order)
+
+    # Changes older than the overlap window have committed before the read,
+    # unless some of them did not fit into the batch
+    since = read_at - timedelta(seconds=settings.ORDERS_FEED_OVERLAP)
+    if len(orders) == settings.ORDERS_FEED_BATCH_SIZE:
+        since = min(since, orders[-1].updated_at)
+    cursor.since = max(cursor.since, since)
+    cursor.trim()
+
+    return orders
+
+
+def serialize_order_change(order):
+    return {
+        'id': order.pk,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'payment_method_display': order.get_payment_method_display(),
+        'total_price': order.total_price,
+        'first_name': order.first_name,
+        'last_name': order.last_name,
+        'contact_phone': str(order.contact_phone),
+        'address': order.address,
+        'comment': order.comment,
+        'restaurant_id': order.restaurant_id,
+        'registered_at': order.registered_at,
+    }
+
+
+def stream_orders_changes(cursor):
+    """Yield server-sent events with orders changes.
+
+    The stream is closed after ORDERS_FEED_MAX_DURATION seconds so that a
+    worker is not held forever, clients reconnect automatically sending the
+    last event id.
+    """
+
+    yield f'retry: {settings.ORDERS_FEED_RETRY_MS}\n\n'
+
+    started_at = last_sent_at = time.monotonic()
+    while time.monotonic() - started_at < (
+        settings.ORDERS_FEED_MAX_DURATION
+    ):
+        event_cursor = OrdersCursor(cursor.since, cursor.seen)
+        orders = get_orders_changes(cursor)
+        for order in orders:
+            event_cursor.add(order)
+            data = json.dumps(
+                serialize_order_change(order),
+                cls=DjangoJSONEncoder,
+                ensure_ascii=False,
+            )
+            yield (
+                f'id: {event_cursor.encode()}\n'
+                f'event: order\n'
+                f'data: {data}\n\n'
+            )
+
+        now = time.monotonic()
+        if orders:
+            last_sent_at = now
+        elif now - last_sent_at >= settings.ORDERS_FEED_HEARTBEAT:
+            last_sent_at = now
+            yield ': ping\n\n'
+
+        if len(orders) < settings.ORDERS_FEED_BATCH_SIZE:
+            time.sleep(settings.ORDERS_FEED_POLL_INTERVAL)
+
+
+class FeedConnection:
+    """Stream of orders changes holding a slot of `feed_connections`.
+
+    The slot is freed when the server closes the response, even if the
+    stream was never started.
+    """
+
+    def __init__(self, cursor):
+        self.events = stream_orders_changes(cursor)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        if not self.closed:
+            self.closed = True
+            feed_connections.release()
@@ -0,0 +1,219 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import features, Image
+
+from .caching import products_payload
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+DERIVATIVES_DIR = 'derivatives'
+WEBP_QUALITY = 80
+WEBP_SUPPORTED = features.check('webp')
+
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+derivatives_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def save_image(image, storage, name, image_format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_derivatives(image_file):
+    """Save downscaled copies of the image in its format and in WebP.
+
+    Copies are made for every width of DERIVATIVE_WIDTHS smaller than the
+    image, WebP copy is made for the original width as well. WebP copies
+    are skipped if Pillow is built without WebP support.
+
+    Args:
+        image_file: file of an image field
+
+    Returns:
+        dictionary with name of the source image and, for every MIME type,
+        list of [width, file name] pairs sorted by width
+    """
+
+    storage = image_file.storage
+    with image_file.open('rb'), Image.open(image_file) as source:
+        source.load()
+
+    original_format = source.format
+    image_format = (
+        original_format if original_format in FORMAT_EXTENSIONS else 'PNG'
+    )
+    if image_format == 'JPEG' and source.mode not in ('RGB', 'L'):
+        source = source.convert('RGB')
+
+    fallback_type = Image.MIME[image_format]
+    formats = {fallback_type: []}
+    if original_format == image_format:
+        formats[fallback_type].append([source.width, image_file.name])
+    webp_images = formats.setdefault('image/webp', [])
+
+    stem = os.path.splitext(os.path.basename(image_file.name))[0]
+    for width in DERIVATIVE_WIDTHS:
+        if width >= source.width:
+            break
+
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        name = f'{DERIVATIVES_DIR}/{stem}-{width}w'
+
+        if image_format != 'WEBP':
+            fallback_name = save_image(
+                resized,
+                storage,
+                f'{name}.{FORMAT_EXTENSIONS[image_format]}',
+                image_format,
+                optimize=True,
+            )
+            formats[fallback_type].append([width, fallback_name])
+
+        if WEBP_SUPPORTED:
+            webp_name = save_image(
+                resized, storage, f'{name}.webp', 'WEBP', quality=WEBP_QUALITY
+            )
+            webp_images.append([width, webp_name])
+
+    if WEBP_SUPPORTED and image_format != 'WEBP':
+        webp_name = save_image(
+            source,
+            storage,
+            f'{DERIVATIVES_DIR}/{stem}-{source.width}w.webp',
+            'WEBP',
+            quality=WEBP_QUALITY,
+        )
+        webp_images.append([source.width, webp_name])
+
+    return {
+        'source': image_file.name,
+        'formats': {
+            mime_type: sorted(images)
+            for mime_type, images in formats.items()
+            if images
+        },
+    }
+
+
+def delete_derivatives(product):
+    storage = product.image.storage
+    for images in product.image_derivatives.get('formats', {}).values():
+        for _, name in images:
+            if name.startswith(f'{DERIVATIVES_DIR}/'):
+                storage.delete(name)
+
+
+def update_product_derivatives(product, force=False):
+    """Generate derivatives of the product image unless they are fresh.
+
+    Derivatives are saved with a queryset update, so no model signals are
+    sent, and products payload is invalidated explicitly.
+
+    Args:
+        product: product to generate derivatives for
+        force: regenerate derivatives even if they are fresh
+
+    Returns:
+        True if derivatives were generated
+    """
+
+    if not product.image:
+        return False
+    if not force and (
+        product.image_derivatives.get('source') == product.image.name
+    ):
+        return False
+
+    derivatives = generate_derivatives(product.image)
+    updated = Product.objects.filter(
+        pk=product.pk, image=product.image.name
+    ).update(image_derivatives=derivatives)
+    if updated:
+        delete_derivatives(product)
+        products_payload.invalidate()
+    return bool(updated)
+
+
+def generate_derivatives_in_background(product_id):
+    try:
+        product = Product.objects.filter(pk=product_id).first()
+        if product:
+            update_product_derivatives(product)
+    except Exception:
+        logger.exception(
+            'Failed to generate image derivatives of product %s', product_id
+        )
+    finally:
+        connection.close()
+
+
+def schedule_derivatives(product):
+    """Generate derivatives in a background thread after commit."""
+
+    if not product.image or (
+        product.image_derivatives.get('source') == product.image.name
+    ):
+        return
+
+    transaction.on_commit(
+        lambda: derivatives_executor.submit(
+            generate_derivatives_in_background, product.pk
+        )
+    )
+
+
+def get_srcsets(product):
+    """Return srcset strings of the product image by MIME type.
+
+    Empty if derivatives of the current image are not generated yet.
+    """
+
+    derivatives = product.image_derivatives
+    if not product.image or derivatives.get('source') != product.image.name:
+        return {}
+
+    storage = product.image.storage
+    return {
+        mime_type: ', '.join(
+            f'{storage.url(name)} {width}w' for width, name in images
+        )
+        for mime_type, images in derivatives['formats'].items()
+    }
+
+
+def get_image_url(product, width):
+    """Return URL of the smallest copy of the product image not narrower
+    than width, URL of the image itself if there is no such copy."""
+
+    derivatives = product.image_derivatives
+    if derivatives.get('source') != product.image.name:
+        return product.image.url
+
+    fallback_images = next(
+        (
+            images
+            for mime_type, images in derivatives['formats'].items()
+            if mime_type != 'image/webp'
+        ),
+        derivatives['formats'].get('image/webp', []),
+    )
+    for image_width, name in fallback_images:
+        if image_width >= width:
+            return product.image.storage.url(name)
+    return product.image.url
@@ -0,0 +1,146 @@
+import heapq
+import math
+import random
+import time
+from collections import defaultdict, namedtuple
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import assign_restaurants
+from foodcartapp.matching import RestaurantCandidate
+
+
+Restaurant = namedtuple('Restaurant', ['id', 'name'])
+
+EARTH_RADIUS = 6371.0088
+
+
+def get_great_circle_distance(first, second):
+    """Return haversine distance between two points in km."""
+
+    first_latitude, first_longitude = map(math.radians, first)
+    second_latitude, second_longitude = map(math.radians, second)
+    haversine = (
+        math.sin((second_latitude - first_latitude) / 2) ** 2
+        + math.cos(first_latitude)
+        * math.cos(second_latitude)
+        * math.sin((second_longitude - first_longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(haversine))
+
+
+def assign_nearest(candidates_by_order, capacities):
+    """Assign every order the nearest restaurant with free capacity."""
+
+    capacities = dict(capacities)
+    assigned_restaurants = {}
+    for order, candidates in candidates_by_order.items():
+        for candidate in candidates:
+            if capacities.get(candidate.restaurant, 0) > 0:
+                assigned_restaurants[order] = candidate.restaurant
+                capacities[candidate.restaurant] -= 1
+                break
+    return assigned_restaurants
+
+
+def get_random_point(randomizer, center, spread):
+    latitude, longitude = center
+    return (
+        latitude + randomizer.gauss(0, spread),
+        longitude + randomizer.gauss(0, spread),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark restaurants dispatch on synthetic cities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--cities', type=int, default=5)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--capacity', type=int, default=60)
+        parser.add_argument(
+            '--candidates',
+            type=int,
+            default=20,
+            help='Number of nearest candidates considered per order',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        randomizer = random.Random(options['seed'])
+
+        cities = [
+            (randomizer.uniform(45, 60), randomizer.uniform(30, 60))
+            for _ in range(options['cities'])
+        ]
+        restaurants = {
+            Restaurant(number, f'restaurant {number}'): get_random_point(
+                randomizer, randomizer.choice(cities), 0.05
+            )
+            for number in range(options['restaurants'])
+        }
+        restaurants_by_product = defaultdict(set)
+        for restaurant in restaurants:
+            for product_id in range(options['products']):
+                if randomizer.random() < 0.9:
+                    restaurants_by_product[product_id].add(restaurant)
+        orders = [
+            (
+                number,
+                get_random_point(randomizer, randomizer.choice(cities), 0.07),
+                randomizer.sample(
+                    range(options['products']), randomizer.randint(1, 4)
+                ),
+            )
+            for number in range(options['orders'])
+        ]
+
+        started_at = time.perf_counter()
+        candidates_by_order = {}
+        for number, coordinates, product_ids in orders:
+            matching_restaurants = set.intersection(
+                *(restaurants_by_product[product] for product in product_ids)
+            )
+            candidates_by_order[number] = heapq.nsmallest(
+                options['candidates'],
+                (
+                    RestaurantCandidate(
+                        restaurant,
+                        distance=get_great_circle_distance(
+                            coordinates, restaurants[restaurant]
+                        ),
+                    )
+                    for restaurant in matching_restaurants
+                ),
+                key=RestaurantCandidate.get_sort_key,
+            )
+        self.stdout.write(
+            f'candidates: {time.perf_counter() - started_at:.3f} s'
+        )
+
+        capacities = {
+            restaurant: options['capacity'] for restaurant in restaurants
+        }
+        for name, assign in (
+            ('greedy batch', assign_restaurants),
+            ('nearest per order', assign_nearest),
+        ):
+            started_at = time.perf_counter()
+            assigned_restaurants = assign(candidates_by_order, capacities)
+            elapsed = time.perf_counter() - started_at
+
+            total_distance = sum(
+                next(
+                    candidate.distance
+                    for candidate in candidates_by_order[order]
+                    if candidate.restaurant == restaurant
+                )
+                for order, restaurant in assigned_restaurants.items()
+            )
+            self.stdout.write(
+                f'{name}: {elapsed:.3f} s, '
+                f'assigned {len(assigned_restaurants)} orders, '
+                f'total distance {total_distance:.0f} km'
+            )
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import dispatch_orders
+
+
+class Command(BaseCommand):
+    help = 'Assign restaurants to unprocessed orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of orders assigned together in one pass',
+        )
+        parser.add_argument(
+            '--max-open-orders',
+            type=int,
+            default=settings.RESTAURANT_MAX_OPEN_ORDERS,
+            help='Maximal number of undelivered orders per restaurant',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print assignment without saving it',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Dispatch orders periodically instead of once',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds to sleep between dispatches in loop mode',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            assigned_restaurants = dispatch_orders(
+                options['batch_size'],
+                options['max_open_orders'],
+                dry_run=options['dry_run'],
+            )
+
+            for order, restaurant in assigned_restaurants.items():
+                self.stdout.write(f'{order.pk}: {restaurant}')
+            self.stdout.write(
+                f'Assigned restaurants to {len(assigned_restaurants)} orders'
+            )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.export import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    export_orders,
+    get_day_start,
+)
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Export orders with positions and total prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+        )
+        parser.add_argument(
+            '--registered-from',
+            type=date.fromisoformat,
+            help='First day of registration, YYYY-MM-DD',
+        )
+        parser.add_argument(
+            '--registered-to',
+            type=date.fromisoformat,
+            help='Last day of registration, YYYY-MM-DD',
+        )
+        parser.add_argument('--status', choices=Order.OrderStatus.values)
+        parser.add_argument(
+            '--output',
+            help='File to write to, standard output by default',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        registered_from = options['registered_from']
+        registered_to = options['registered_to']
+
+        orders = Order.objects.registered_between(
+            start=registered_from and get_day_start(registered_from),
+            end=registered_to
+            and get_day_start(registered_to + timedelta(days=1)),
+        )
+        if options['status']:
+            orders = orders.filter(status=options['status'])
+
+        _, chunks = export_orders(
+            orders, options['format'], chunk_size=options['chunk_size']
+        )
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(
+            options['output'], 'w', encoding='utf-8', newline=''
+        ) as output:
+            output.writelines(chunks)
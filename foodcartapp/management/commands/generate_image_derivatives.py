@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.images import update_product_derivatives
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate downscaled and WebP copies of product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate copies which are up to date',
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        for product in Product.objects.exclude(image='').iterator():
+            try:
+                generated += update_product_derivatives(
+                    product, force=options['force']
+                )
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'{product.pk}: {error}')
+
+        self.stdout.write(f'Generated image copies of {generated} products')
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Banner
+
+
+class Command(BaseCommand):
+    help = 'Copy images of banners missing in media storage from assets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default=os.path.join(settings.BASE_DIR, 'assets'),
+            help='Directory to take images from, by their file names',
+        )
+
+    def handle(self, *args, **options):
+        loaded = 0
+        for banner in Banner.objects.exclude(image=''):
+            storage = banner.image.storage
+            if storage.exists(banner.image.name):
+                continue
+
+            path = os.path.join(
+                options['source'], os.path.basename(banner.image.name)
+            )
+            if not os.path.exists(path):
+                self.stderr.write(f'{banner.pk}: {path} not found')
+                continue
+
+            with open(path, 'rb') as image:
+                storage.save(banner.image.name, File(image))
+            loaded += 1
+
+        self.stdout.write(f'Loaded images of {loaded} banners')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recount restaurants where every product is available'
+
+    def handle(self, *args, **options):
+        updated = Product.objects.all().refresh_availability()
+        self.stdout.write(f'Updated {updated} products')
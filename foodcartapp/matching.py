@@ -0,0 +1,49 @@
+import heapq
+from typing import Any, NamedTuple, Optional
+
+from django.conf import settings
+
+
+class RestaurantCandidate(NamedTuple):
+    """Restaurant able to handle an order.
+
+    Distance is in km. It is None when the order or the restaurant address
+    is not recognized, `unresolved` tells which one.
+    """
+
+    ORDER_UNRESOLVED = 'order'
+    RESTAURANT_UNRESOLVED = 'restaurant'
+
+    restaurant: Any
+    distance: Optional[float] = None
+    unresolved: Optional[str] = None
+
+    @property
+    def eta(self):
+        """Estimated delivery time in minutes or None if unknown."""
+
+        if self.distance is None or not settings.DELIVERY_SPEED:
+            return None
+        return round(self.distance / settings.DELIVERY_SPEED * 60)
+
+    def get_sort_key(self):
+        return (
+            self.distance is None,
+            self.distance or 0,
+            self.restaurant.name,
+        )
+
+
+def get_nearest_candidates(candidates, limit=None):
+    """Return candidates sorted by distance, unresolved ones last.
+
+    Args:
+        candidates: iterable of restaurant candidates
+        limit: maximal number of candidates to return, all if None
+    """
+
+    if limit is None:
+        return sorted(candidates, key=RestaurantCandidate.get_sort_key)
+    return heapq.nsmallest(
+        limit, candidates, key=RestaurantCandidate.get_sort_key
+    )
@@ -0,0 +1,81 @@
+from django.db import transaction
+
+from .caching import availability_matrix, products_payload
+from .models import Product, RestaurantMenuItem
+
+
+MENU_ITEMS_BATCH_SIZE = 1000
+
+
+def update_menu_availability(changes):
+    """Switch availability of many menu items at once.
+
+    Menu items missing in restaurant menus are created. Items are saved
+    with bulk queries which don't send model signals, so availability of
+    affected products is recounted and caches are invalidated once for the
+    whole batch.
+
+    Args:
+        changes: iterable of dictionaries with `restaurant` and `product`
+            ids and `availability` flag, the last change of a menu item wins
+
+    Returns:
+        dictionary with numbers of updated and created menu items
+    """
+
+    availability_by_item = {
+        (change['restaurant'], change['product']): change['availability']
+        for change in changes
+    }
+    if not availability_by_item:
+        return {'updated': 0, 'created': 0}
+
+    restaurant_ids = {
+        restaurant_id for restaurant_id, _ in availability_by_item
+    }
+    product_ids = {product_id for _, product_id in availability_by_item}
+
+    with transaction.atomic():
+        existing_items = {
+            (menu_item.restaurant_id, menu_item.product_id): menu_item
+            for menu_item in RestaurantMenuItem.objects.select_for_update()
+            .filter(restaurant__in=restaurant_ids, product__in=product_ids)
+            .only('pk', 'restaurant', 'product', 'availability')
+        }
+
+        changed_items = []
+        new_items = []
+        for (restaurant_id, product_id), availability in (
+            availability_by_item.items()
+        ):
+            menu_item = existing_items.get((restaurant_id, product_id))
+            if menu_item is None:
+                new_items.append(
+                    RestaurantMenuItem(
+                        restaurant_id=restaurant_id,
+                        product_id=product_id,
+                        availability=availability,
+                    )
+                )
+            elif menu_item.availability != availability:
+                menu_item.availability = availability
+                changed_items.append(menu_item)
+
+        RestaurantMenuItem.objects.bulk_update(
+            changed_items, ['availability'], batch_size=MENU_ITEMS_BATCH_SIZE
+        )
+        RestaurantMenuItem.objects.bulk_create(
+            new_items, batch_size=MENU_ITEMS_BATCH_SIZE
+        )
+
+        affected_product_ids = {
+            menu_item.product_id for menu_item in changed_items + new_items
+        }
+        if affected_product_ids:
+            Product.objects.filter(
+                pk__in=affected_product_ids
+            ).refresh_availability()
+            transaction.on_commit(products_payload.invalidate)
+            transaction.on_commit(availability_matrix.invalidate)
+
+    return {'updated': len(changed_items), 'created': len(new_items)}
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.10 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+BANNERS = [
+    ('Burger', 'burger.jpg', 'Tasty Burger at your door step'),
+    ('Spices', 'food.jpg', 'All Cuisines'),
+    ('New York', 'tasty.jpg', 'Food is incomplete without a tasty dessert'),
+]
+
+
+def create_banners(apps, schema_editor):
+    # Image files are copied into media by the load_banners command
+    Banner = apps.get_model('foodcartapp', 'Banner')
+    Banner.objects.bulk_create(
+        Banner(
+            title=title,
+            image=f'banners/{filename}',
+            text=text,
+            position=position,
+        )
+        for position, (title, filename, text) in enumerate(BANNERS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0050_product_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=50, verbose_name='заголовок')),
+                ('image', models.ImageField(upload_to='banners/', verbose_name='картинка')),
+                ('text', models.CharField(blank=True, max_length=200, verbose_name='текст')),
+                ('position', models.PositiveIntegerField(db_index=True, default=0, verbose_name='порядок')),
+                ('active_from', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='показывать с')),
+                ('active_until', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='показывать до')),
+            ],
+            options={
+                'verbose_name': 'баннер',
+                'verbose_name_plural': 'баннеры',
+                'ordering': ['position', 'pk'],
+            },
+        ),
+        migrations.RunPython(create_banners, migrations.RunPython.noop),
+    ]
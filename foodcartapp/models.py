@@ -1,14 +1,14 @@
-from collections import Counter
-
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from geopy import distance
 from phonenumber_field.modelfields import PhoneNumberField
 
 from geoposition.models import Place
+from geoposition.distances import get_distances
+from .matching import get_nearest_candidates, RestaurantCandidate
 
 
 class Restaurant(models.Model):
@@ -34,10 +34,29 @@ class Restaurant(models.Model):
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = RestaurantMenuItem.objects.filter(
-            availability=True
-        ).values_list('product')
-        return self.filter(pk__in=products)
+        return self.filter(available_restaurants_count__gt=0)
+
+    def refresh_availability(self):
+        """Recount restaurants where products are available.
+
+        Returns:
+            number of updated products
+        """
+
+        available_menu_items_count = (
+            RestaurantMenuItem.objects.filter(
+                product=OuterRef('pk'),
+                availability=True,
+            )
+            .values('product')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        return self.update(
+            available_restaurants_count=Coalesce(
+                Subquery(available_menu_items_count), 0
+            )
+        )
 
 
 class ProductCategory(models.Model):
@@ -78,6 +97,18 @@ class Product(models.Model):
         max_length=200,
         blank=True,
     )
+    available_restaurants_count = models.PositiveIntegerField(
+        'в продаже в ресторанах',
+        default=0,
+        db_index=True,
+        editable=False,
+    )
+    image_derivatives = models.JSONField(
+        'уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
 
     objects = ProductQuerySet.as_manager()
 
@@ -114,8 +145,26 @@ class RestaurantMenuItem(models.Model):
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        menu_item = super().from_db(db, field_names, values)
+        # product_id is missing if the field is deferred
+        menu_item.loaded_product_id = menu_item.__dict__.get('product_id')
+        return menu_item
+
 
 class OrderQuerySet(models.QuerySet):
+    def unprocessed(self):
+        return self.filter(status=Order.OrderStatus.UNPROCESSED)
+
+    def registered_between(self, start=None, end=None):
+        orders = self
+        if start:
+            orders = orders.filter(registered_at__gte=start)
+        if end:
+            orders = orders.filter(registered_at__lt=end)
+        return orders
+
     def with_total_prices(self):
         return self.annotate(
             total_price=Sum(
@@ -123,64 +172,110 @@ class OrderQuerySet(models.QuerySet):
             )
         )
 
-    def add_restaurants_with_distances(self, available_menu_items):
-        """Add matching restaurants with distances to orders
+    def get_matching_restaurants(self):
+        """Return restaurants that could handle all positions of orders.
+
+        Matching is done in the database by relational division: order
+        positions are joined with available menu items and grouped by order
+        and restaurant, a group is kept if it covers every distinct product
+        of the order.
+
+        Returns:
+            queryset of dictionaries with `order`, `restaurant` and
+            `matched_products` keys
+        """
+
+        order_products_count = (
+            OrderPosition.objects.filter(order=OuterRef('order'))
+            .values('order')
+            .annotate(count=Count('product', distinct=True))
+            .values('count')
+        )
+        return (
+            OrderPosition.objects.filter(
+                order__in=self,
+                product__menu_items__availability=True,
+            )
+            .values('order', restaurant=F('product__menu_items__restaurant'))
+            .annotate(matched_products=Count('product', distinct=True))
+            .filter(matched_products=Subquery(order_products_count))
+            .order_by()
+        )
+
+    def add_restaurant_candidates(self, limit=None):
+        """Add nearest matching restaurants to orders
         (Restaurants that could handle all corresponding order positions).
 
+        Distances are read from the precomputed distances table, missing
+        ones are calculated and stored.
+
         Args:
-            orders: unprocessed orders
-            available_menu_items: all available menu items
+            limit: maximal number of nearest restaurants to add to an order,
+                all matching restaurants if None
         """
 
+        orders = {order.pk: order for order in self}
+        matches = list(
+            Order.objects.filter(pk__in=orders).get_matching_restaurants()
+        )
+        restaurants = Restaurant.objects.in_bulk(
+            {match['restaurant'] for match in matches}
+        )
+
+        for order in orders.values():
+            order.matching_restaurants = []
+        for match in matches:
+            orders[match['order']].matching_restaurants.append(
+                restaurants[match['restaurant']]
+            )
+
         addresses = {
-            menu_item.restaurant.address for menu_item in available_menu_items
-        }.union({address['address'] for address in self.values('address')})
+            restaurant.address for restaurant in restaurants.values()
+        }.union({order.address for order in orders.values()})
 
         places = {
-            place.address: (place.latitude, place.longitude)
-            for place in Place.objects.filter(address__in=addresses)
+            address: place
+            for address, place in Place.objects.get_places(addresses).items()
+            if place.latitude is not None
         }
 
+        distances = get_distances(
+            (places[order.address], places[restaurant.address])
+            for order in self
+            if order.address in places
+            for restaurant in order.matching_restaurants
+            if restaurant.address in places
+        )
+
         for order in self:
-            order_products = [
-                order_position.product
-                for order_position in order.order_positions.all()
-            ]
-
-            restaurants_with_at_least_one_order_item = [
-                menu_item.restaurant
-                for menu_item in available_menu_items
-                if menu_item.product in order_products
-            ]
-
-            matching_restaurants = [
-                restaurant
-                for restaurant, total_items in Counter(
-                    restaurants_with_at_least_one_order_item
-                ).items()
-                if total_items == len(order_products)
-            ]
-
-            restaurants_with_distances = [
-                (
-                    restaurant,
-                    (
-                        '{:.3f} км'.format(
-                            distance.distance(
-                                order_coordinates,
-                                places[restaurant.address],
-                            ).km
-                        )
+            order_place = places.get(order.address)
+
+            if not order_place:
+                candidates = (
+                    RestaurantCandidate(
+                        restaurant,
+                        unresolved=RestaurantCandidate.ORDER_UNRESOLVED,
                     )
-                    if not None in (order_coordinates := places[order.address])
-                    else 'адрес не распознан',
+                    for restaurant in order.matching_restaurants
+                )
+            else:
+                candidates = (
+                    RestaurantCandidate(
+                        restaurant,
+                        distance=distances[
+                            (order_place.id, places[restaurant.address].id)
+                        ],
+                    )
+                    if restaurant.address in places
+                    else RestaurantCandidate(
+                        restaurant,
+                        unresolved=RestaurantCandidate.RESTAURANT_UNRESOLVED,
+                    )
+                    for restaurant in order.matching_restaurants
                 )
-                for restaurant in matching_restaurants
-            ]
 
-            order.restaurants_with_distances = sorted(
-                restaurants_with_distances,
-                key=lambda x: x[1],
+            order.restaurant_candidates = get_nearest_candidates(
+                candidates, limit
             )
 
         return self
@@ -253,6 +348,12 @@ class Order(models.Model):
         db_index=True,
     )
 
+    updated_at = models.DateTimeField(
+        'дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+
     objects = OrderQuerySet.as_manager()
 
     class Meta:
@@ -296,3 +397,62 @@ class OrderPosition(models.Model):
 
     def __str__(self):
         return f'{self.__class__.__name__}, {self.quantity} {self.product}'
+
+
+class BannerQuerySet(models.QuerySet):
+    def active(self, now=None):
+        now = now or timezone.now()
+        return self.filter(
+            Q(active_from__isnull=True) | Q(active_from__lte=now),
+            Q(active_until__isnull=True) | Q(active_until__gt=now),
+        )
+
+    def get_next_change(self, now=None):
+        """Return the nearest time some banner starts or stops being shown.
+
+        Returns:
+            datetime or None if set of active banners won't change by itself
+        """
+
+        now = now or timezone.now()
+        changes = self.aggregate(
+            next_start=Min('active_from', filter=Q(active_from__gt=now)),
+            next_end=Min('active_until', filter=Q(active_until__gt=now)),
+        )
+        return min(
+            (change for change in changes.values() if change is not None),
+            default=None,
+        )
+
+
+class Banner(models.Model):
+    title = models.CharField('заголовок', max_length=50)
+    image = models.ImageField('картинка', upload_to='banners/')
+    text = models.CharField('текст', max_length=200, blank=True)
+    position = models.PositiveIntegerField(
+        'порядок',
+        default=0,
+        db_index=True,
+    )
+    active_from = models.DateTimeField(
+        'показывать с',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    active_until = models.DateTimeField(
+        'показывать до',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['position', 'pk']
+
+    def __str__(self):
+        return self.title
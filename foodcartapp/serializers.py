@@ -2,7 +2,13 @@ from django.core.exceptions import ValidationError
 import phonenumbers as ph_n
 from rest_framework import serializers
 
-from .models import Order, OrderPosition
+from .models import Order, OrderPosition, Product
+
+
+class MenuItemAvailabilitySerializer(serializers.Serializer):
+    restaurant = serializers.IntegerField()
+    product = serializers.IntegerField()
+    availability = serializers.BooleanField()
 
 
 class OrderPositionSerializer(serializers.ModelSerializer):
@@ -10,6 +16,8 @@ class OrderPositionSerializer(serializers.ModelSerializer):
         model = OrderPosition
         fields = ['product', 'quantity']
 
+    product = serializers.IntegerField()
+
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,5 +39,31 @@ class OrderSerializer(serializers.ModelSerializer):
         child=OrderPositionSerializer(), allow_empty=False, write_only=True
     )
 
+    def validate_products(self, positions):
+        """Replace product ids with products fetched in a single query.
+
+        Products preloaded into serializer context under `products` key
+        are used instead of querying the database.
+        """
+
+        product_ids = {position['product'] for position in positions}
+
+        products = self.context.get('products')
+        if products is None:
+            products = Product.objects.in_bulk(product_ids)
+
+        missing_ids = sorted(product_ids - set(products))
+        if missing_ids:
+            raise serializers.ValidationError(
+                'Товары не найдены: {}'.format(
+                    ', '.join(str(product_id) for product_id in missing_ids)
+                )
+            )
+
+        return [
+            {**position, 'product': products[position['product']]}
+            for position in positions
+        ]
+
     def create(self, validated_data):
         return Order.objects.create(**validated_data)
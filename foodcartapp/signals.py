@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from geoposition.handle_coordinates import enqueue_addresses
+from .caching import (
+    availability_matrix,
+    banners_payload,
+    products_payload,
+)
+from .images import schedule_derivatives
+from .models import (
+    Banner,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+@receiver(post_save, sender=Restaurant)
+def enqueue_restaurant_address(sender, instance, **kwargs):
+    if instance.address:
+        transaction.on_commit(lambda: enqueue_addresses([instance.address]))
+
+
+@receiver(post_save, sender=Product)
+def generate_image_derivatives(sender, instance, **kwargs):
+    schedule_derivatives(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_products_payload(sender, **kwargs):
+    transaction.on_commit(products_payload.invalidate)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners_payload(sender, **kwargs):
+    transaction.on_commit(banners_payload.invalidate)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_availability_matrix(sender, **kwargs):
+    transaction.on_commit(availability_matrix.invalidate)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_product_availability(sender, instance, **kwargs):
+    product_ids = {
+        instance.product_id,
+        getattr(instance, 'loaded_product_id', None),
+    } - {None}
+    Product.objects.filter(pk__in=product_ids).refresh_availability()
+    instance.loaded_product_id = instance.product_id
+
+
+@receiver(post_save, sender=Product)
+def recount_saved_product_availability(sender, instance, **kwargs):
+    # Saving a product writes the counter it was loaded with, which may be
+    # outdated already
+    Product.objects.filter(pk=instance.pk).refresh_availability()
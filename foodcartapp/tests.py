@@ -0,0 +1,1026 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from geoposition.models import Place
+from .caching import (
+    availability_matrix,
+    banners_payload,
+    CachedPayload,
+    products_payload,
+)
+from .dispatch import dispatch_orders, get_restaurants_capacities
+from .export import export_orders
+from .feed import get_orders_changes, OrdersCursor
+from .matching import get_nearest_candidates, RestaurantCandidate
+from .models import (
+    Banner,
+    Order,
+    OrderPosition,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+class CachedPayloadTest(SimpleTestCase):
+    def test_least_recently_used_variant_is_evicted(self):
+        payload = CachedPayload('test-lru', max_entries=2)
+        builds = []
+
+        def get(variant):
+            def build():
+                builds.append(variant)
+                return variant
+
+            return payload.get(build, variant)
+
+        get('first')
+        get('second')
+        get('first')
+        get('third')
+
+        get('first')
+        self.assertEqual(builds, ['first', 'second', 'third'])
+
+        get('second')
+        self.assertEqual(builds, ['first', 'second', 'third', 'second'])
+
+
+class ProductListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        products_payload.entries.clear()
+
+        self.category = ProductCategory.objects.create(name='Бургеры')
+        self.product = Product.objects.create(
+            name='Чизбургер',
+            category=self.category,
+            price=100,
+            image='burger.png',
+        )
+        self.restaurant = Restaurant.objects.create(name='Star Burger')
+        self.menu_item = RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant, product=self.product
+        )
+
+    def get_products(self, data=None, **headers):
+        return self.client.get('/api/products/', data, **headers)
+
+    def change(self, update):
+        with self.captureOnCommitCallbacks(execute=True):
+            update()
+
+    def test_payload_is_built_once(self):
+        response = self.get_products()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(
+            [product['name'] for product in response.json()], ['Чизбургер']
+        )
+
+        with self.assertNumQueries(0):
+            cached_response = self.get_products()
+
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = self.get_products()['ETag']
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.get_products(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_change_invalidates_payload(self):
+        etag = self.get_products()['ETag']
+
+        self.product.name = 'Гамбургер'
+        self.change(self.product.save)
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Гамбургер')
+
+    def test_category_change_invalidates_payload(self):
+        etag = self.get_products()['ETag']
+
+        self.category.name = 'Сэндвичи'
+        self.change(self.category.save)
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['category']['name'], 'Сэндвичи')
+
+    def test_menu_change_invalidates_payload(self):
+        etag = self.get_products()['ETag']
+
+        self.menu_item.availability = False
+        self.change(self.menu_item.save)
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+        version = products_payload.get_version()
+        self.change(self.menu_item.delete)
+        self.assertNotEqual(products_payload.get_version(), version)
+
+    def test_change_is_not_visible_before_commit(self):
+        etag = self.get_products()['ETag']
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.name = 'Гамбургер'
+            self.product.save()
+
+        self.assertEqual(
+            self.get_products(HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.assertTrue(callbacks)
+
+    def test_products_are_filtered_and_paginated(self):
+        special_products = [
+            Product.objects.create(
+                name=f'Комбо {number}',
+                category=self.category,
+                price=200,
+                image='burger.png',
+                special_status=True,
+            )
+            for number in range(3)
+        ]
+        for product in special_products:
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant, product=product
+            )
+
+        page = self.get_products(
+            data={'special': 'true', 'fields': 'id,name', 'limit': 2}
+        ).json()
+        self.assertEqual(
+            page['results'],
+            [
+                {'id': product.id, 'name': product.name}
+                for product in special_products[:2]
+            ],
+        )
+
+        page = self.get_products(
+            data={
+                'special': 'true',
+                'fields': 'id,name',
+                'limit': 2,
+                'cursor': page['next_cursor'],
+            }
+        ).json()
+        self.assertEqual(
+            page,
+            {
+                'results': [
+                    {
+                        'id': special_products[2].id,
+                        'name': special_products[2].name,
+                    },
+                ],
+                'next_cursor': None,
+            },
+        )
+
+    def test_invalid_query_is_rejected(self):
+        response = self.get_products(data={'fields': 'name,secret'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+
+
+class BannersApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        banners_payload.entries.clear()
+
+    def get_banners(self, **headers):
+        return self.client.get('/api/banners/', **headers)
+
+    def test_migrated_banners_are_listed(self):
+        response = self.get_banners()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (banner['title'], banner['src'])
+                for banner in response.json()
+            ],
+            [
+                ('Burger', '/media/banners/burger.jpg'),
+                ('Spices', '/media/banners/food.jpg'),
+                ('New York', '/media/banners/tasty.jpg'),
+            ],
+        )
+
+        response = self.get_banners(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_banners_are_shown_in_their_window(self):
+        now = timezone.now()
+        Banner.objects.update(active_until=now - timedelta(minutes=1))
+        scheduled = Banner.objects.create(
+            title='Soon',
+            image='banners/soon.jpg',
+            active_from=now + timedelta(minutes=1),
+        )
+        self.assertEqual(self.get_banners().json(), [])
+
+        with mock.patch(
+            'django.utils.timezone.now',
+            return_value=now + timedelta(minutes=2),
+        ):
+            banners = self.get_banners().json()
+
+        self.assertEqual(
+            [banner['title'] for banner in banners], [scheduled.title]
+        )
+
+    def test_command_loads_missing_images(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        burger_path = os.path.join(media_root.name, 'banners', 'burger.jpg')
+        os.makedirs(os.path.dirname(burger_path))
+        with open(burger_path, 'wb') as burger:
+            burger.write(b'uploaded')
+
+        output = io.StringIO()
+        with override_settings(MEDIA_ROOT=media_root.name):
+            call_command('load_banners', stdout=output)
+            call_command('load_banners', stdout=output)
+
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ['Loaded images of 2 banners', 'Loaded images of 0 banners'],
+        )
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(burger_path))),
+            ['burger.jpg', 'food.jpg', 'tasty.jpg'],
+        )
+        with open(burger_path, 'rb') as burger:
+            self.assertEqual(burger.read(), b'uploaded')
+
+
+class ProductAvailabilityCounterTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(
+            name='Чизбургер', price=100, image='burger.png'
+        )
+        self.fries = Product.objects.create(
+            name='Картофель фри', price=50, image='fries.png'
+        )
+        self.restaurants = [
+            Restaurant.objects.create(name=f'Star Burger {number}')
+            for number in range(2)
+        ]
+
+    def assertCounts(self, burger_count, fries_count):
+        self.burger.refresh_from_db()
+        self.fries.refresh_from_db()
+        self.assertEqual(
+            (
+                self.burger.available_restaurants_count,
+                self.fries.available_restaurants_count,
+            ),
+            (burger_count, fries_count),
+        )
+
+    def test_counter_follows_menu_items(self):
+        menu_items = [
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=self.burger
+            )
+            for restaurant in self.restaurants
+        ]
+        self.assertCounts(2, 0)
+
+        menu_items[0].availability = False
+        menu_items[0].save()
+        self.assertCounts(1, 0)
+
+        menu_items[1].product = self.fries
+        menu_items[1].save()
+        self.assertCounts(0, 1)
+
+        menu_items[1].delete()
+        self.assertCounts(0, 0)
+
+    def test_counter_survives_product_save(self):
+        stale_burger = Product.objects.get(pk=self.burger.pk)
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurants[0], product=self.burger
+        )
+
+        stale_burger.name = 'Гамбургер'
+        stale_burger.save()
+        self.assertCounts(1, 0)
+
+    def test_counter_follows_deferred_menu_item(self):
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurants[0], product=self.burger
+        )
+
+        menu_item = RestaurantMenuItem.objects.only('availability').get()
+        menu_item.availability = False
+        menu_item.save()
+        self.assertCounts(0, 0)
+
+    def test_counter_follows_restaurant_delete(self):
+        for restaurant in self.restaurants:
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=self.burger
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=self.fries
+            )
+        self.assertCounts(2, 2)
+
+        self.restaurants[0].delete()
+        self.assertCounts(1, 1)
+        self.assertQuerysetEqual(
+            Product.objects.available().order_by('name'),
+            [self.fries, self.burger],
+        )
+
+        self.restaurants[1].delete()
+        self.assertCounts(0, 0)
+        self.assertFalse(Product.objects.available().exists())
+
+
+class RegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(
+                name=f'Бургер {number}', price=100, image='burger.png'
+            )
+            for number in range(10)
+        ]
+
+    def post_order(self, positions):
+        return self.client.post(
+            '/api/order/',
+            {
+                'firstname': 'Иван',
+                'lastname': 'Иванов',
+                'phonenumber': '+79291000000',
+                'address': 'Москва, Тверская 1',
+                'products': positions,
+            },
+            content_type='application/json',
+        )
+
+    def test_query_count_does_not_depend_on_positions(self):
+        for positions_count in (1, 10):
+            positions = [
+                {'product': product.pk, 'quantity': 1}
+                for product in self.products[:positions_count]
+            ]
+            with self.subTest(positions_count=positions_count):
+                # Savepoint, products, order, positions, savepoint release
+                with self.assertNumQueries(5):
+                    response = self.post_order(positions)
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_missing_products_are_reported_together(self):
+        response = self.post_order(
+            [
+                {'product': self.products[0].pk, 'quantity': 1},
+                {'product': 999, 'quantity': 1},
+                {'product': 998, 'quantity': 2},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'products': ['Товары не найдены: 998, 999']}
+        )
+        self.assertFalse(Order.objects.exists())
+
+
+class RegisterOrdersBulkTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(
+            name='Чизбургер', price=100, image='burger.png'
+        )
+        self.fries = Product.objects.create(
+            name='Картофель фри', price=50, image='fries.png'
+        )
+        self.client.force_login(
+            User.objects.create_user('manager', password='password')
+        )
+
+    def get_order_data(self, address, *positions):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79291000000',
+            'address': address,
+            'products': [
+                {'product': product_id, 'quantity': quantity}
+                for product_id, quantity in positions
+            ],
+        }
+
+    def post_orders(self, orders_data):
+        return self.client.post(
+            '/api/order/bulk/', orders_data, content_type='application/json'
+        )
+
+    def test_authentication_is_required(self):
+        self.client.logout()
+
+        response = self.post_orders(
+            [self.get_order_data('Москва, Тверская 1', (self.burger.pk, 1))]
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Order.objects.exists())
+
+    def test_valid_orders_are_created_and_invalid_reported(self):
+        response = self.post_orders(
+            [
+                self.get_order_data(
+                    'Москва, Тверская 1',
+                    (self.burger.pk, 2),
+                    (self.fries.pk, 1),
+                ),
+                self.get_order_data('Москва, Арбат 1', (999, 1)),
+                self.get_order_data('Москва, Арбат 2', (self.fries.pk, 3)),
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'invalid', 'created'],
+        )
+        self.assertIn('products', results[1]['errors'])
+
+        orders = Order.objects.with_total_prices().order_by('pk')
+        self.assertEqual(
+            [(order.id, order.address) for order in orders],
+            [
+                (results[0]['id'], 'Москва, Тверская 1'),
+                (results[2]['id'], 'Москва, Арбат 2'),
+            ],
+        )
+        self.assertEqual(
+            [order.total_price for order in orders], [250, 150]
+        )
+
+    def test_ndjson_stream_is_accepted(self):
+        orders_data = [
+            self.get_order_data('Москва, Тверская 1', (self.burger.pk, 1)),
+            self.get_order_data('Москва, Арбат 1', (self.fries.pk, 1)),
+        ]
+
+        response = self.client.post(
+            '/api/order/bulk/',
+            '\n'.join(json.dumps(order_data) for order_data in orders_data),
+            content_type='application/x-ndjson',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()],
+            ['created', 'created'],
+        )
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_products_are_loaded_once(self):
+        orders_data = [
+            self.get_order_data(
+                f'Москва, Тверская {number}',
+                (self.burger.pk, 1),
+                (self.fries.pk, 1),
+            )
+            for number in range(20)
+        ]
+
+        with mock.patch(
+            'foodcartapp.views.Product.objects.in_bulk',
+            wraps=Product.objects.in_bulk,
+        ) as in_bulk:
+            response = self.post_orders(orders_data)
+
+        self.assertEqual(response.status_code, 200)
+        in_bulk.assert_called_once_with({self.burger.pk, self.fries.pk})
+        self.assertEqual(Order.objects.count(), 20)
+
+    def test_too_many_orders_are_rejected(self):
+        order_data = self.get_order_data(
+            'Москва, Тверская 1', (self.burger.pk, 1)
+        )
+
+        with mock.patch('foodcartapp.views.MAX_BULK_ORDERS', 2):
+            response = self.post_orders([order_data] * 3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_product_ids_are_parsed_like_in_serializer(self):
+        response = self.post_orders(
+            [
+                self.get_order_data(
+                    'Москва, Тверская 1', (f'{self.burger.pk}.0', 1)
+                ),
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['status'], 'created')
+
+
+class MenuAvailabilityApiTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(
+            name='Чизбургер', price=100, image='burger.png'
+        )
+        self.fries = Product.objects.create(
+            name='Картофель фри', price=50, image='fries.png'
+        )
+        self.restaurants = [
+            Restaurant.objects.create(name=f'Star Burger {number}')
+            for number in range(2)
+        ]
+        self.menu_item = RestaurantMenuItem.objects.create(
+            restaurant=self.restaurants[0], product=self.burger
+        )
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+
+    def post_changes(self, changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/api/menu/availability/',
+                changes,
+                content_type='application/json',
+            )
+
+    def test_staff_is_required(self):
+        self.client.force_login(User.objects.create_user('customer'))
+
+        response = self.post_changes([])
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_menu_items_are_updated_and_created(self):
+        products_version = products_payload.get_version()
+        matrix_version = availability_matrix.get_version()
+
+        response = self.post_changes(
+            [
+                {
+                    'restaurant': self.restaurants[0].pk,
+                    'product': self.burger.pk,
+                    'availability': False,
+                },
+                {
+                    'restaurant': self.restaurants[1].pk,
+                    'product': self.fries.pk,
+                    'availability': False,
+                },
+                {
+                    'restaurant': self.restaurants[1].pk,
+                    'product': self.fries.pk,
+                    'availability': True,
+                },
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 1, 'created': 1})
+        self.assertQuerysetEqual(
+            RestaurantMenuItem.objects.order_by('pk').values_list(
+                'restaurant', 'product', 'availability'
+            ),
+            [
+                (self.restaurants[0].pk, self.burger.pk, False),
+                (self.restaurants[1].pk, self.fries.pk, True),
+            ],
+            transform=tuple,
+        )
+        self.assertQuerysetEqual(
+            Product.objects.available().order_by('pk'),
+            [self.fries],
+        )
+        self.assertNotEqual(products_payload.get_version(), products_version)
+        self.assertNotEqual(availability_matrix.get_version(), matrix_version)
+
+    def test_unknown_ids_reject_whole_batch(self):
+        response = self.post_changes(
+            [
+                {
+                    'restaurant': self.restaurants[0].pk,
+                    'product': self.burger.pk,
+                    'availability': False,
+                },
+                {'restaurant': 999, 'product': 998, 'availability': True},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                'restaurant': 'Рестораны не найдены: 999',
+                'product': 'Товары не найдены: 998',
+            },
+        )
+        self.menu_item.refresh_from_db()
+        self.assertTrue(self.menu_item.availability)
+
+
+class ExportOrdersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger, cls.fries = [
+            Product.objects.create(
+                name=name, category=category, price=price, image='burger.png'
+            )
+            for name, price in (('Чизбургер', 100), ('Картошка', 50))
+        ]
+        cls.order = Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address='Москва, Тверская 1',
+        )
+        OrderPosition.objects.bulk_create(
+            [
+                OrderPosition(
+                    order=cls.order, product=cls.burger, quantity=2, price=100
+                ),
+                OrderPosition(
+                    order=cls.order, product=cls.fries, quantity=1, price=50
+                ),
+            ]
+        )
+        cls.empty_order = Order.objects.create(
+            first_name='Пётр',
+            last_name='Петров',
+            contact_phone='+79291000001',
+            address='Москва, Арбат 1',
+            status=Order.OrderStatus.PROCESSED,
+        )
+
+    def export(self, export_format, orders=None, chunk_size=1):
+        if orders is None:
+            orders = Order.objects.all()
+        _, chunks = export_orders(orders, export_format, chunk_size)
+        return ''.join(chunks)
+
+    def test_csv_has_line_per_position(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv'))))
+
+        self.assertEqual(
+            [
+                (row['id'], row['product_name'], row['quantity'])
+                for row in rows
+            ],
+            [
+                (str(self.order.pk), 'Чизбургер', '2'),
+                (str(self.order.pk), 'Картошка', '1'),
+                (str(self.empty_order.pk), '', ''),
+            ],
+        )
+        self.assertEqual(Decimal(rows[0]['total_price']), 250)
+        self.assertEqual(rows[0]['contact_phone'], '+79291000000')
+
+    def test_ndjson_has_line_per_order(self):
+        orders = [
+            json.loads(line)
+            for line in self.export('ndjson').splitlines()
+        ]
+
+        self.assertEqual(
+            [order['id'] for order in orders],
+            [self.order.pk, self.empty_order.pk],
+        )
+        self.assertEqual(
+            orders[0]['positions'],
+            [
+                {
+                    'product': self.burger.pk,
+                    'product_name': 'Чизбургер',
+                    'quantity': 2,
+                    'price': '100.00',
+                },
+                {
+                    'product': self.fries.pk,
+                    'product_name': 'Картошка',
+                    'quantity': 1,
+                    'price': '50.00',
+                },
+            ],
+        )
+        self.assertEqual(orders[1]['positions'], [])
+
+    def test_positions_are_not_loaded_at_once(self):
+        with self.assertNumQueries(2):
+            _, chunks = export_orders(Order.objects.all(), 'ndjson', 1)
+            next(chunks)
+
+    def test_command_filters_orders(self):
+        output = io.StringIO()
+        call_command(
+            'export_orders',
+            format='ndjson',
+            status=Order.OrderStatus.PROCESSED,
+            registered_from=timezone.localdate(),
+            stdout=output,
+        )
+
+        self.assertEqual(
+            [
+                json.loads(line)['id']
+                for line in output.getvalue().splitlines()
+            ],
+            [self.empty_order.pk],
+        )
+
+
+@override_settings(ORDERS_FEED_OVERLAP=10, ORDERS_FEED_BATCH_SIZE=3)
+class OrdersFeedTest(TestCase):
+    def create_order(self, address, age=0):
+        order = Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address=address,
+        )
+        if age:
+            Order.objects.filter(pk=order.pk).update(
+                updated_at=timezone.now() - timedelta(seconds=age)
+            )
+        return order
+
+    def get_addresses(self, cursor):
+        return [order.address for order in get_orders_changes(cursor)]
+
+    def test_cursor_is_encoded(self):
+        since = timezone.now()
+        cursor = OrdersCursor(
+            since, {1: since, 2: since + timedelta(microseconds=5)}
+        )
+
+        decoded = OrdersCursor.decode(cursor.encode())
+
+        self.assertEqual(decoded.since, cursor.since)
+        self.assertEqual(decoded.seen, cursor.seen)
+        for invalid_cursor in (None, '', 'abc', '1.2', '1.2:x'):
+            with self.subTest(cursor=invalid_cursor):
+                self.assertIsNone(OrdersCursor.decode(invalid_cursor))
+
+    def test_current_cursor_skips_visible_changes(self):
+        self.create_order('Москва, Тверская 1', age=60)
+        self.create_order('Москва, Тверская 2', age=5)
+
+        cursor = OrdersCursor.current()
+        self.create_order('Москва, Тверская 3')
+
+        self.assertEqual(self.get_addresses(cursor), ['Москва, Тверская 3'])
+        self.assertEqual(self.get_addresses(cursor), [])
+
+    def test_late_commit_in_overlap_window_is_delivered(self):
+        cursor = OrdersCursor.current()
+        self.create_order('Москва, Тверская 1')
+        self.assertEqual(self.get_addresses(cursor), ['Москва, Тверская 1'])
+
+        # Saved before the delivered order, but committed after it
+        self.create_order('Москва, Тверская 2', age=5)
+        self.create_order('Москва, Тверская 3', age=30)
+
+        self.assertEqual(self.get_addresses(cursor), ['Москва, Тверская 2'])
+
+    def test_changes_exceeding_batch_are_delivered_in_order(self):
+        cursor = OrdersCursor.current()
+        for number in range(5):
+            self.create_order(f'Москва, Тверская {number}')
+
+        self.assertEqual(
+            self.get_addresses(cursor),
+            [f'Москва, Тверская {number}' for number in range(3)],
+        )
+        self.assertEqual(
+            self.get_addresses(OrdersCursor.decode(cursor.encode())),
+            ['Москва, Тверская 3', 'Москва, Тверская 4'],
+        )
+        self.assertLessEqual(len(cursor.seen), 3)
+
+    def test_changed_order_is_delivered_again(self):
+        cursor = OrdersCursor.current()
+        order = self.create_order('Москва, Тверская 1')
+        self.get_addresses(cursor)
+
+        order.address = 'Москва, Арбат 1'
+        order.save()
+
+        self.assertEqual(self.get_addresses(cursor), ['Москва, Арбат 1'])
+
+
+class NearestCandidatesTest(SimpleTestCase):
+    def test_candidates_are_ranked_by_numeric_distance(self):
+        restaurants = [
+            Restaurant(name=name) for name in ('Первый', 'Второй', 'Третий')
+        ]
+        candidates = [
+            RestaurantCandidate(
+                restaurants[0],
+                unresolved=RestaurantCandidate.RESTAURANT_UNRESOLVED,
+            ),
+            RestaurantCandidate(restaurants[1], distance=10.0),
+            RestaurantCandidate(restaurants[2], distance=9.0),
+        ]
+
+        for limit, expected in (
+            (None, [restaurants[2], restaurants[1], restaurants[0]]),
+            (2, [restaurants[2], restaurants[1]]),
+        ):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    [
+                        candidate.restaurant
+                        for candidate in get_nearest_candidates(
+                            candidates, limit
+                        )
+                    ],
+                    expected,
+                )
+
+    @override_settings(DELIVERY_SPEED=30)
+    def test_eta_is_derived_from_distance(self):
+        restaurant = Restaurant(name='Первый')
+
+        self.assertEqual(RestaurantCandidate(restaurant, 5.0).eta, 10)
+        self.assertIsNone(RestaurantCandidate(restaurant).eta)
+
+
+class DispatchOrdersTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(
+            name='Чизбургер', price=100, image='burger.png'
+        )
+        self.fries = Product.objects.create(
+            name='Картофель фри', price=50, image='fries.png'
+        )
+
+    def create_restaurant(self, name, address, coordinates, products):
+        Place.objects.create(
+            address=address, latitude=coordinates[0], longitude=coordinates[1]
+        )
+        restaurant = Restaurant.objects.create(name=name, address=address)
+        for product in products:
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product
+            )
+        return restaurant
+
+    def create_order(self, address, coordinates, products, **fields):
+        Place.objects.get_or_create(
+            address=address,
+            defaults={
+                'latitude': coordinates[0],
+                'longitude': coordinates[1],
+            },
+        )
+        order = Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address=address,
+            **fields,
+        )
+        for product in products:
+            OrderPosition.objects.create(
+                order=order, product=product, quantity=1, price=product.price
+            )
+        return order
+
+    def test_capacity_counts_open_orders_only(self):
+        restaurant = self.create_restaurant(
+            'Star Burger', 'Москва, Тверская 1', (55.76, 37.6), [self.burger]
+        )
+        for status, delivered_at in (
+            (Order.OrderStatus.UNPROCESSED, None),
+            (Order.OrderStatus.UNPROCESSED, timezone.now()),
+            (Order.OrderStatus.PROCESSED, None),
+        ):
+            self.create_order(
+                'Москва, Тверская 10',
+                (55.77, 37.6),
+                [self.burger],
+                restaurant=restaurant,
+                status=status,
+                delivered_at=delivered_at,
+            )
+
+        self.assertEqual(get_restaurants_capacities(3), {restaurant: 2})
+        self.assertEqual(get_restaurants_capacities(1), {})
+
+    def test_nearest_free_restaurants_are_assigned(self):
+        near = self.create_restaurant(
+            'Рядом', 'Москва, Тверская 1', (55.76, 37.6), [self.burger]
+        )
+        far = self.create_restaurant(
+            'Далеко', 'Москва, Ленинский 1', (55.7, 37.58), [self.burger]
+        )
+        orders = [
+            self.create_order(
+                f'Москва, Тверская {number}', (55.77, 37.6), [self.burger]
+            )
+            for number in range(10, 13)
+        ]
+
+        assigned_restaurants = dispatch_orders(
+            batch_size=10, max_open_orders=2
+        )
+
+        self.assertEqual(
+            assigned_restaurants,
+            {orders[0]: near, orders[1]: near, orders[2]: far},
+        )
+        self.assertEqual(
+            [order.restaurant for order in Order.objects.order_by('pk')],
+            [near, near, far],
+        )
+
+    def test_unassignable_orders_do_not_block_queue(self):
+        restaurant = self.create_restaurant(
+            'Star Burger', 'Москва, Тверская 1', (55.76, 37.6), [self.burger]
+        )
+        for number in range(3):
+            self.create_order(
+                f'Москва, Арбат {number}', (55.75, 37.59), [self.fries]
+            )
+        order = self.create_order(
+            'Москва, Тверская 10', (55.77, 37.6), [self.burger]
+        )
+
+        assigned_restaurants = dispatch_orders(
+            batch_size=2, max_open_orders=5
+        )
+
+        self.assertEqual(assigned_restaurants, {order: restaurant})
+
+    def test_capacity_is_shared_by_batches(self):
+        restaurant = self.create_restaurant(
+            'Star Burger', 'Москва, Тверская 1', (55.76, 37.6), [self.burger]
+        )
+        orders = [
+            self.create_order(
+                f'Москва, Тверская {number}', (55.77, 37.6), [self.burger]
+            )
+            for number in range(10, 15)
+        ]
+
+        assigned_restaurants = dispatch_orders(
+            batch_size=2, max_open_orders=3
+        )
+
+        self.assertEqual(
+            assigned_restaurants, {order: restaurant for order in orders[:3]}
+        )
+
+    def test_dry_run_does_not_save_assignment(self):
+        restaurant = self.create_restaurant(
+            'Star Burger', 'Москва, Тверская 1', (55.76, 37.6), [self.burger]
+        )
+        order = self.create_order(
+            'Москва, Тверская 10', (55.77, 37.6), [self.burger]
+        )
+
+        assigned_restaurants = dispatch_orders(
+            batch_size=10, max_open_orders=1, dry_run=True
+        )
+
+        self.assertEqual(assigned_restaurants, {order: restaurant})
+        order.refresh_from_db()
+        self.assertIsNone(order.restaurant)
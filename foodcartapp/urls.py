@@ -1,6 +1,12 @@
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import (
+    banners_list_api,
+    product_list_api,
+    register_order,
+    register_orders_bulk,
+    update_menu_availability_api,
+)
 
 
 app_name = "foodcartapp"
@@ -9,4 +15,6 @@ urlpatterns = [
     path('products/', product_list_api),
     path('banners/', banners_list_api),
     path('order/', register_order),
+    path('order/bulk/', register_orders_bulk),
+    path('menu/availability/', update_menu_availability_api),
 ]
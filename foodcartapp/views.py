@@ -1,43 +1,130 @@
-from django.db import transaction
+from django import forms
+from django.db import connection, transaction
 from django.http import JsonResponse
-from django.templatetags.static import static
-from rest_framework.decorators import api_view
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from rest_framework.decorators import (
+    api_view,
+    parser_classes,
+    permission_classes,
+)
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import Order, OrderPosition, Product
-from .serializers import OrderSerializer
+from geoposition.handle_coordinates import enqueue_addresses
+from .caching import banners_payload, products_payload
+from .images import get_srcsets
+from .menu import update_menu_availability
+from .models import Banner, Order, OrderPosition, Product, Restaurant
+from .parsers import NDJSONParser
+from .serializers import (
+    MenuItemAvailabilitySerializer,
+    OrderPositionSerializer,
+    OrderSerializer,
+)
+
+
+def serialize_banners():
+    return [
+        {
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
+        }
+        for banner in Banner.objects.active()
+    ]
 
 
 def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse(
-        [
-            {
-                'title': 'Burger',
-                'src': static('burger.jpg'),
-                'text': 'Tasty Burger at your door step',
-            },
-            {
-                'title': 'Spices',
-                'src': static('food.jpg'),
-                'text': 'All Cuisines',
-            },
-            {
-                'title': 'New York',
-                'src': static('tasty.jpg'),
-                'text': 'Food is incomplete without a tasty dessert',
-            },
-        ],
-        safe=False,
-        json_dumps_params={
-            'ensure_ascii': False,
-            'indent': 4,
-        },
+    return banners_payload.get_response(
+        request,
+        serialize_banners,
+        get_expires_at=Banner.objects.get_next_change,
     )
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
+ORDERS_BATCH_SIZE = 1000
+MAX_BULK_ORDERS = 10000
+MAX_AVAILABILITY_CHANGES = 10000
+
+PRODUCT_FIELDS = [
+    'id',
+    'name',
+    'price',
+    'special_status',
+    'description',
+    'category',
+    'image',
+    'image_srcset',
+    'restaurant',
+]
+
+
+class ProductsQueryForm(forms.Form):
+    category = forms.IntegerField(required=False)
+    special = forms.NullBooleanField(required=False)
+    fields = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=100)
+    cursor = forms.CharField(required=False)
+
+    def clean_fields(self):
+        fields = [
+            field.strip()
+            for field in self.cleaned_data['fields'].split(',')
+            if field.strip()
+        ]
+        unknown_fields = set(fields) - set(PRODUCT_FIELDS)
+        if unknown_fields:
+            raise forms.ValidationError(
+                'Неизвестные поля: {}'.format(
+                    ', '.join(sorted(unknown_fields))
+                )
+            )
+        return fields or PRODUCT_FIELDS
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if not cursor:
+            return None
+        try:
+            return int(urlsafe_base64_decode(cursor))
+        except ValueError:
+            raise forms.ValidationError('Некорректный курсор')
+
+
+def serialize_products(
+    category=None,
+    special=None,
+    fields=PRODUCT_FIELDS,
+    limit=None,
+    cursor=None,
+):
+    """Serialize available products.
+
+    Args:
+        category: id of category to filter products by
+        special: filter products by special status if not None
+        fields: fields to include into serialized products
+        limit: page size, all products are returned if None
+        cursor: id of the last product of the previous page
+
+    Returns:
+        list of products if limit is None, otherwise page with products and
+        cursor of the next page
+    """
+
+    products = (
+        Product.objects.select_related('category').available().order_by('id')
+    )
+    if category is not None:
+        products = products.filter(category_id=category)
+    if special is not None:
+        products = products.filter(special_status=special)
+    if cursor is not None:
+        products = products.filter(id__gt=cursor)
+    if limit is not None:
+        products = products[:limit + 1]
 
     dumped_products = []
     for product in products:
@@ -52,47 +139,220 @@ def product_list_api(request):
                 'name': product.category.name,
             },
             'image': product.image.url,
+            'image_srcset': get_srcsets(product),
             'restaurant': {
                 'id': product.id,
                 'name': product.name,
             },
         }
-        dumped_products.append(dumped_product)
-    return JsonResponse(
-        dumped_products,
-        safe=False,
-        json_dumps_params={
-            'ensure_ascii': False,
-            'indent': 4,
-        },
-    )
+        dumped_products.append(
+            {field: dumped_product[field] for field in fields}
+        )
 
+    if limit is None:
+        return dumped_products
 
-@transaction.atomic
-@api_view(['POST'])
-def register_order(request):
-    serializer = OrderSerializer(data=request.data)
-    serializer.is_valid(raise_exception=True)
+    next_cursor = None
+    if len(dumped_products) > limit:
+        dumped_products = dumped_products[:limit]
+        last_product = products[limit - 1]
+        next_cursor = urlsafe_base64_encode(str(last_product.id).encode())
+
+    return {
+        'results': dumped_products,
+        'next_cursor': next_cursor,
+    }
+
+
+def product_list_api(request):
+    form = ProductsQueryForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse(
+            form.errors, status=400, json_dumps_params={'ensure_ascii': False}
+        )
 
-    order_data = serializer.validated_data
+    query = form.cleaned_data
+    query['fields'] = tuple(query['fields'])
 
-    new_order = Order.objects.create(
-        first_name=order_data['first_name'],
-        last_name=order_data['last_name'],
-        address=order_data['address'],
-        contact_phone=order_data['contact_phone'],
+    return products_payload.get_response(
+        request,
+        lambda: serialize_products(**query),
+        variant=tuple(sorted(query.items())),
     )
 
+
+def create_orders(orders_data):
+    """Create orders with their positions in a few batched queries.
+
+    Args:
+        orders_data: validated data of orders
+
+    Returns:
+        list of created orders
+    """
+
+    orders = [
+        Order(
+            first_name=order_data['first_name'],
+            last_name=order_data['last_name'],
+            address=order_data['address'],
+            contact_phone=order_data['contact_phone'],
+        )
+        for order_data in orders_data
+    ]
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(orders, batch_size=ORDERS_BATCH_SIZE)
+    else:
+        for order in orders:
+            order.save()
+
     order_positions = [
         OrderPosition(
             product=item['product'],
-            order=new_order,
+            order=order,
             quantity=item['quantity'],
             price=item['product'].price,
         )
+        for order, order_data in zip(orders, orders_data)
         for item in order_data['products']
     ]
 
-    OrderPosition.objects.bulk_create(order_positions)
+    OrderPosition.objects.bulk_create(
+        order_positions, batch_size=ORDERS_BATCH_SIZE
+    )
+
+    transaction.on_commit(
+        lambda: enqueue_addresses({order.address for order in orders})
+    )
+
+    return orders
+
+
+def get_ordered_product_ids(orders_data):
+    """Collect product ids of raw orders data to preload products.
+
+    Ids are parsed by the serializer field, so that products are found for
+    every id the serializer accepts.
+    """
+
+    product_field = OrderPositionSerializer().fields['product']
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict):
+            continue
+        positions = order_data.get('products')
+        if not isinstance(positions, list):
+            continue
+        for position in positions:
+            if not isinstance(position, dict):
+                continue
+            try:
+                product_ids.add(
+                    product_field.to_internal_value(position.get('product'))
+                )
+            except ValidationError:
+                continue
+    return product_ids
+
+
+@transaction.atomic
+@api_view(['POST'])
+def register_order(request):
+    serializer = OrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    [new_order] = create_orders([serializer.validated_data])
 
     return Response(OrderSerializer(new_order).data)
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+@permission_classes([IsAuthenticated])
+def register_orders_bulk(request):
+    """Register many orders at once.
+
+    Accepts JSON array or NDJSON stream of orders in the same format as
+    register_order. Valid orders are created, invalid ones are reported
+    with their errors.
+    """
+
+    orders_data = request.data
+    if not isinstance(orders_data, list):
+        raise ValidationError('Ожидается список заказов')
+    if len(orders_data) > MAX_BULK_ORDERS:
+        raise ValidationError(
+            f'Не больше {MAX_BULK_ORDERS} заказов за один запрос'
+        )
+
+    products = Product.objects.in_bulk(get_ordered_product_ids(orders_data))
+
+    results = []
+    valid_orders_data = []
+    for order_data in orders_data:
+        serializer = OrderSerializer(
+            data=order_data, context={'products': products}
+        )
+        if serializer.is_valid():
+            results.append({'status': 'created'})
+            valid_orders_data.append(serializer.validated_data)
+        else:
+            results.append({'status': 'invalid', 'errors': serializer.errors})
+
+    with transaction.atomic():
+        new_orders = create_orders(valid_orders_data)
+
+    created_results = (
+        result for result in results if result['status'] == 'created'
+    )
+    for result, order in zip(created_results, new_orders):
+        result['id'] = order.id
+
+    return Response(results)
+
+
+def get_missing_ids(model, ids):
+    existing_ids = model.objects.filter(pk__in=ids).values_list(
+        'pk', flat=True
+    )
+    return sorted(set(ids) - set(existing_ids))
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+@permission_classes([IsAdminUser])
+def update_menu_availability_api(request):
+    """Switch availability of many menu items in one transaction.
+
+    Accepts a list of `{"restaurant": id, "product": id, "availability":
+    bool}` changes.
+    """
+
+    if not isinstance(request.data, list):
+        raise ValidationError('Ожидается список изменений')
+    if len(request.data) > MAX_AVAILABILITY_CHANGES:
+        raise ValidationError(
+            f'Не больше {MAX_AVAILABILITY_CHANGES} изменений за один запрос'
+        )
+
+    serializer = MenuItemAvailabilitySerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    changes = serializer.validated_data
+
+    errors = {}
+    for field, model, message in (
+        ('restaurant', Restaurant, 'Рестораны не найдены: {}'),
+        ('product', Product, 'Товары не найдены: {}'),
+    ):
+        missing_ids = get_missing_ids(
+            model, {change[field] for change in changes}
+        )
+        if missing_ids:
+            errors[field] = message.format(
+                ', '.join(str(missing_id) for missing_id in missing_ids)
+            )
+    if errors:
+        raise ValidationError(errors)
+
+    return Response(update_menu_availability(changes))
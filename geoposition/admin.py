@@ -1,8 +1,13 @@
 from django.contrib import admin
 
-from .models import Place
+from .models import GeocodingTask, Place
 
 
 @admin.register(Place)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('address', 'latitude', 'longitude', 'updated_at')
+
+
+@admin.register(GeocodingTask)
+class GeocodingTaskAdmin(admin.ModelAdmin):
+    list_display = ('address', 'created_at', 'scheduled_at', 'attempts')
@@ -0,0 +1,92 @@
+from geopy import distance
+
+from .models import Place, PlaceDistance
+from .postgis import calculate_distances, is_postgis_enabled
+
+
+def get_distances(place_pairs):
+    """Return distances between pairs of places in km.
+
+    Distances are read from the database. Missing ones are calculated and
+    stored for later use.
+
+    Args:
+        place_pairs: iterable of (origin, destination) places, both having
+            known coordinates
+
+    Returns:
+        dictionary mapping (origin id, destination id) pairs to distances
+    """
+
+    place_pairs = {
+        (origin.id, destination.id): (origin, destination)
+        for origin, destination in place_pairs
+    }
+    if not place_pairs:
+        return {}
+
+    origin_ids = {origin_id for origin_id, _ in place_pairs}
+    destination_ids = {destination_id for _, destination_id in place_pairs}
+
+    distances = {
+        (origin_id, destination_id): km
+        for origin_id, destination_id, km in PlaceDistance.objects.filter(
+            origin__in=origin_ids,
+            destination__in=destination_ids,
+        ).values_list('origin', 'destination', 'distance')
+    }
+
+    missing_pairs = [pair for pair in place_pairs if pair not in distances]
+    if is_postgis_enabled():
+        calculated_distances = calculate_distances(missing_pairs)
+    else:
+        calculated_distances = {}
+        for pair in missing_pairs:
+            origin, destination = place_pairs[pair]
+            calculated_distances[pair] = distance.distance(
+                origin.point, destination.point
+            ).km
+
+    missing_distances = [
+        PlaceDistance(
+            origin=place_pairs[pair][0],
+            destination=place_pairs[pair][1],
+            distance=km,
+        )
+        for pair, km in calculated_distances.items()
+    ]
+    PlaceDistance.objects.bulk_create(
+        missing_distances, batch_size=1000, ignore_conflicts=True
+    )
+
+    distances.update(
+        {
+            (place_distance.origin.id, place_distance.destination.id): (
+                place_distance.distance
+            )
+            for place_distance in missing_distances
+        }
+    )
+    return distances
+
+
+def fill_distances(address_pairs):
+    """Calculate and store distances between places with known coordinates.
+
+    Args:
+        address_pairs: iterable of (origin address, destination address)
+            pairs, pairs with unknown places are skipped
+    """
+
+    address_pairs = set(address_pairs)
+    addresses = {address for pair in address_pairs for address in pair}
+    places = {
+        address: place
+        for address, place in Place.objects.get_places(addresses).items()
+        if place.latitude is not None
+    }
+    get_distances(
+        (places[origin_address], places[destination_address])
+        for origin_address, destination_address in address_pairs
+        if origin_address in places and destination_address in places
+    )
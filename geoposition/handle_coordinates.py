@@ -1,70 +1,386 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
 import requests
+from requests.adapters import HTTPAdapter
+
+from .models import GeocodingTask, Place, PlaceDistance
+from .normalization import normalize_address
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: number of tokens added per second
+        capacity: maximal number of tokens, allows bursts of that size
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError('Rate of token bucket must be positive')
+
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
 
-from .models import Place
+    def acquire(self):
+        """Block until a token is available and take it."""
 
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate,
+                )
+                self.updated_at = now
 
-def get_places_missing_in_db(orders, menu_items):
-    """Return set of places with specified addresses that are not yet in the database.
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# Shared by all batches, so the rate limit holds for the whole process
+geocoder_rate_limiter = TokenBucket(settings.GEOCODER_RATE_LIMIT)
+
+
+def create_geocoder_session(pool_size):
+    """Create HTTP session with connection pool of specified size."""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_addresses_to_geocode(addresses):
+    """Return addresses without fresh places in the database.
 
     Args:
-        orders: unprocessed orders
-        menu_items: all available menu items
+        addresses: addresses to check
+
+    Returns:
+        set of addresses, one per normalized form
     """
 
-    addresses_to_check = {order.address for order in orders}.union(
-        {item.restaurant.address for item in menu_items}
+    fresh_addresses = set(
+        Place.objects.with_addresses(addresses)
+        .fresh()
+        .values_list('normalized_address', flat=True)
     )
 
-    places_in_db = Place.objects.filter(address__in=addresses_to_check)
+    addresses_by_key = {
+        normalize_address(address): address for address in addresses
+    }
 
-    addresses_not_in_db = {
+    return {
         address
-        for address in addresses_to_check
-        if address not in {place.address for place in places_in_db}
+        for key, address in addresses_by_key.items()
+        if key not in fresh_addresses
     }
 
-    return addresses_not_in_db
 
+def save_places(coordinates_by_address):
+    """Create new places and refresh coordinates of existing ones.
 
-def fill_db_with_missing_places(addresses, apikey):
-    """Fill the database with places that are not yet in the database. For every
-    such place functions make a call to Map API and fetches its coordinates.
+    Places are matched by normalized address, so coordinates of an address
+    variant update the place saved for another variant of it. If several
+    variants of one address are passed, found coordinates win.
+
+    Distances from and to refreshed places are dropped to be calculated
+    again.
+
+    Args:
+        coordinates_by_address: dictionary mapping addresses to coordinates
+    """
+
+    coordinates_by_key = {}
+    for address, coordinates in coordinates_by_address.items():
+        key = normalize_address(address)
+        known = coordinates_by_key.get(key)
+        if known and known[1]['latitude'] is not None:
+            continue
+        coordinates_by_key[key] = (address, coordinates)
+
+    now = timezone.now()
+    existing_places = list(
+        Place.objects.with_addresses(coordinates_by_address)
+    )
+    for place in existing_places:
+        _, coordinates = coordinates_by_key[place.normalized_address]
+        place.latitude = coordinates['latitude']
+        place.longitude = coordinates['longitude']
+        place.updated_at = now
+
+    Place.objects.bulk_update(
+        existing_places, ['latitude', 'longitude', 'updated_at']
+    )
+    PlaceDistance.objects.filter(
+        Q(origin__in=existing_places) | Q(destination__in=existing_places)
+    ).delete()
+
+    existing_keys = {place.normalized_address for place in existing_places}
+    Place.objects.bulk_create(
+        [
+            Place(
+                address=address,
+                normalized_address=key,
+                **coordinates,
+            )
+            for key, (address, coordinates) in coordinates_by_key.items()
+            if key not in existing_keys
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def enqueue_addresses(addresses):
+    """Put addresses missing in the database to the geocoding queue.
+
+    Args:
+        addresses: addresses to geocode
+    """
+
+    GeocodingTask.objects.bulk_create(
+        [
+            GeocodingTask(address=address)
+            for address in get_addresses_to_geocode(set(addresses))
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def claim_geocoding_tasks(batch_size):
+    """Take due tasks from the queue for GEOCODING_CLAIM_TIMEOUT seconds.
+
+    Claimed tasks are scheduled to the end of the claim, so other workers
+    skip them while they are geocoded, and if the worker dies they are
+    picked up again after the claim expires.
+
+    Args:
+        batch_size: maximal number of tasks to claim
+
+    Returns:
+        list of claimed tasks
+    """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        tasks = list(
+            GeocodingTask.objects.select_for_update(skip_locked=True)
+            .filter(scheduled_at__lte=now)
+            .order_by('scheduled_at')[:batch_size]
+        )
+        claimed_until = now + timedelta(
+            seconds=settings.GEOCODING_CLAIM_TIMEOUT
+        )
+        GeocodingTask.objects.filter(
+            pk__in=[task.pk for task in tasks]
+        ).update(scheduled_at=claimed_until)
+
+    return tasks
+
+
+def process_geocoding_queue(apikey, batch_size=100):
+    """Geocode a batch of queued addresses which are due.
+
+    Addresses having the same normalized form are geocoded once. Tasks failed
+    because of network or API errors are rescheduled with exponential
+    backoff. After GEOCODING_MAX_ATTEMPTS attempts an address is saved
+    without coordinates.
+
+    Tasks are claimed and completed in two short transactions, geocoder is
+    requested outside of them so that the database is not locked meanwhile.
 
     Args:
-        addresses: addresses missing in the database
         apikey: yandex api key to fetch coordinates
+        batch_size: maximal number of addresses to geocode
+
+    Returns:
+        number of processed tasks
     """
 
-    places_to_add_to_db = [
-        {**{'address': address}, **fetch_coordinates(apikey, address)}
-        for address in addresses
+    tasks = claim_geocoding_tasks(batch_size)
+    if not tasks:
+        return 0
+
+    addresses_by_key = {}
+    for task in tasks:
+        addresses_by_key.setdefault(
+            normalize_address(task.address), task.address
+        )
+
+    found_coordinates = fetch_coordinates_batch(
+        apikey, addresses_by_key.values()
+    )
+
+    found_keys = {normalize_address(address) for address in found_coordinates}
+    failed_tasks = [
+        task
+        for task in tasks
+        if normalize_address(task.address) not in found_keys
     ]
+    for task in failed_tasks:
+        if task.attempts + 1 >= settings.GEOCODING_MAX_ATTEMPTS:
+            found_coordinates[task.address] = {
+                'latitude': None,
+                'longitude': None,
+            }
 
-    Place.objects.bulk_create(
-        [Place(**place_to_add) for place_to_add in places_to_add_to_db]
+    now = timezone.now()
+    with transaction.atomic():
+        save_places(found_coordinates)
+
+        GeocodingTask.objects.filter(
+            pk__in=[task.pk for task in tasks if task not in failed_tasks]
+            + [
+                task.pk
+                for task in failed_tasks
+                if task.address in found_coordinates
+            ]
+        ).delete()
+
+        for task in failed_tasks:
+            if task.address in found_coordinates:
+                continue
+            delay = settings.GEOCODING_RETRY_DELAY * 2 ** task.attempts
+            GeocodingTask.objects.filter(pk=task.pk).update(
+                attempts=F('attempts') + 1,
+                scheduled_at=now + timedelta(seconds=delay),
+            )
+
+    return len(tasks)
+
+
+def get_geocoding_queue_stats():
+    """Return geocoding queue depth and lag of its oldest task in seconds."""
+
+    stats = GeocodingTask.objects.aggregate(
+        oldest_created_at=Min('created_at'),
+        next_scheduled_at=Min('scheduled_at'),
     )
+    oldest_created_at = stats['oldest_created_at']
+
+    return {
+        'depth': GeocodingTask.objects.count(),
+        'lag_seconds': (
+            (timezone.now() - oldest_created_at).total_seconds()
+            if oldest_created_at
+            else 0
+        ),
+        'next_scheduled_at': stats['next_scheduled_at'],
+    }
+
+
+def fetch_coordinates_batch(apikey, addresses, rate_limiter=None):
+    """Fetch coordinates of many addresses concurrently.
+
+    Requests share one pooled HTTP session, their number is bounded by
+    GEOCODER_CONCURRENCY setting and their rate by GEOCODER_RATE_LIMIT
+    across all batches of the process.
+
+    Args:
+        apikey: yandex api token
+        addresses: addresses to fetch coordinates for
+        rate_limiter: token bucket to use instead of the process one
+
+    Returns:
+        dictionary mapping addresses to coordinates, addresses that failed
+        to be geocoded are omitted
+    """
 
+    addresses = list(addresses)
+    if not addresses:
+        return {}
 
-def fetch_coordinates(apikey, address):
+    workers = min(settings.GEOCODER_CONCURRENCY, len(addresses))
+    rate_limiter = rate_limiter or geocoder_rate_limiter
+
+    def fetch(address):
+        try:
+            return address, fetch_coordinates(
+                apikey,
+                address,
+                session=session,
+                rate_limiter=rate_limiter,
+            )
+        except (requests.RequestException, KeyError, ValueError) as error:
+            logger.warning("Failed to geocode %r: %s", address, error)
+            return address, None
+
+    with create_geocoder_session(workers) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(fetch, addresses)
+
+            return {
+                address: coordinates
+                for address, coordinates in results
+                if coordinates is not None
+            }
+
+
+def fetch_coordinates(apikey, address, session=None, rate_limiter=None):
     """Fetch coordinates with yandex api
 
+    Failed requests are retried with exponential backoff.
+
     Args:
         apikey: yandex api token
         address: address to fetch coordinates for
+        session: optional HTTP session to reuse connections
+        rate_limiter: optional token bucket to acquire before every request
 
     Returns:
         dictionary containing coordinates
     """
 
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(
-        base_url,
-        params={
-            "geocode": address,
-            "apikey": apikey,
-            "format": "json",
-        },
-    )
+    http = session or requests
+    attempts = settings.GEOCODER_RETRIES + 1
+
+    for attempt in range(attempts):
+        if rate_limiter:
+            rate_limiter.acquire()
+
+        try:
+            response = http.get(
+                settings.GEOCODER_URL,
+                params={
+                    "geocode": address,
+                    "apikey": apikey,
+                    "format": "json",
+                },
+                timeout=settings.GEOCODER_TIMEOUT,
+            )
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+            if attempt == attempts - 1:
+                raise
+
+        time.sleep(settings.GEOCODER_BACKOFF * 2 ** attempt)
+
     response.raise_for_status()
     found_places = response.json()['response']['GeoObjectCollection'][
         'featureMember'
@@ -75,4 +391,4 @@ def fetch_coordinates(apikey, address):
 
     most_relevant = found_places[0]
     lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return {'latitude': lat, 'longitude': lon}
+    return {'latitude': float(lat), 'longitude': float(lon)}
@@ -0,0 +1,114 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from geopy import distance
+
+from geoposition.models import Place
+from geoposition.postgis import calculate_distances, is_postgis_enabled
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark calculation of distances between places with geopy '
+        'and with PostGIS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--places', type=int, default=20000)
+        parser.add_argument('--pairs', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(**options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def benchmark(self, **options):
+        randomizer = random.Random(options['seed'])
+
+        def get_random_point():
+            return (
+                55.75 + randomizer.gauss(0, 0.1),
+                37.62 + randomizer.gauss(0, 0.15),
+            )
+
+        started_at = time.perf_counter()
+        Place.objects.bulk_create(
+            [
+                Place(
+                    address=f'benchmark place {number}',
+                    normalized_address=f'benchmark place {number}',
+                    latitude=latitude,
+                    longitude=longitude,
+                )
+                for number, (latitude, longitude) in enumerate(
+                    get_random_point() for _ in range(options['places'])
+                )
+            ],
+            batch_size=1000,
+        )
+        self.stdout.write(
+            f'{options["places"]} places created in '
+            f'{time.perf_counter() - started_at:.3f} s'
+        )
+
+        places = {
+            place.pk: place
+            for place in Place.objects.filter(
+                address__startswith='benchmark place '
+            )
+        }
+        place_ids = list(places)
+        pairs = [
+            tuple(randomizer.sample(place_ids, 2))
+            for _ in range(options['pairs'])
+        ]
+
+        def calculate_geopy_distances(pairs):
+            return {
+                (origin_id, destination_id): distance.distance(
+                    places[origin_id].point, places[destination_id].point
+                ).km
+                for origin_id, destination_id in pairs
+            }
+
+        geopy_distances = self.run_calculation(
+            'geopy', pairs, calculate_geopy_distances
+        )
+
+        if not is_postgis_enabled():
+            self.stdout.write(
+                'postgis: skipped, set GEO_POSTGIS on PostgreSQL and run '
+                'install_postgis to compare'
+            )
+            return
+
+        postgis_distances = self.run_calculation(
+            'postgis', pairs, calculate_distances
+        )
+
+        max_difference = max(
+            abs(geopy_distances[pair] - postgis_distances[pair])
+            for pair in pairs
+        )
+        self.stdout.write(f'max difference: {max_difference * 1000:.3f} m')
+
+    def run_calculation(self, name, pairs, calculate):
+        started_at = time.perf_counter()
+        distances = calculate(pairs)
+        elapsed = time.perf_counter() - started_at
+
+        self.stdout.write(
+            f'{name}: {elapsed:.3f} s, '
+            f'{elapsed / len(pairs) * 1000000:.2f} µs per pair'
+        )
+        return distances
@@ -0,0 +1,132 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import Order, Restaurant
+from geoposition.distances import fill_distances
+from geoposition.handle_coordinates import (
+    enqueue_addresses,
+    get_geocoding_queue_stats,
+    process_geocoding_queue,
+)
+from geoposition.models import Place
+from geoposition.normalization import normalize_address
+
+
+def fill_restaurant_distances(updated_since):
+    """Calculate distances between unprocessed orders and restaurants able
+    to handle them, if either place was updated since specified time."""
+
+    updated_addresses = set(
+        Place.objects.filter(updated_at__gte=updated_since).values_list(
+            'normalized_address', flat=True
+        )
+    )
+    if not updated_addresses:
+        return
+
+    matches = list(Order.objects.unprocessed().get_matching_restaurants())
+    order_addresses = dict(
+        Order.objects.filter(
+            pk__in={match['order'] for match in matches}
+        ).values_list('pk', 'address')
+    )
+    restaurant_addresses = dict(
+        Restaurant.objects.filter(
+            pk__in={match['restaurant'] for match in matches}
+        ).values_list('pk', 'address')
+    )
+
+    address_pairs = set()
+    for match in matches:
+        order_address = order_addresses[match['order']]
+        restaurant_address = restaurant_addresses[match['restaurant']]
+        if (
+            normalize_address(order_address) in updated_addresses
+            or normalize_address(restaurant_address) in updated_addresses
+        ):
+            address_pairs.add((order_address, restaurant_address))
+    fill_distances(address_pairs)
+
+
+class Command(BaseCommand):
+    help = 'Geocode addresses from the geocoding queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling it',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep when the queue is empty',
+        )
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--enqueue-missing',
+            action='store_true',
+            help='Enqueue addresses of unprocessed orders and restaurants '
+            'missing in the database or outdated there before start and '
+            'then every --refresh-interval seconds',
+        )
+        parser.add_argument(
+            '--refresh-interval',
+            type=float,
+            default=60 * 60,
+            help='Seconds between enqueueing missing and outdated addresses',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue depth and lag and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = get_geocoding_queue_stats()
+            self.stdout.write(
+                f'depth: {stats["depth"]}, lag: {stats["lag_seconds"]:.0f} s'
+            )
+            return
+
+        enqueued_at = None
+        while True:
+            if options['enqueue_missing'] and (
+                enqueued_at is None
+                or time.monotonic() - enqueued_at
+                >= options['refresh_interval']
+            ):
+                enqueue_missing_addresses()
+                enqueued_at = time.monotonic()
+
+            started_at = timezone.now()
+            processed = process_geocoding_queue(
+                settings.YANDEX_API_TOKEN,
+                batch_size=options['batch_size'],
+            )
+            if processed:
+                self.stdout.write(f'Processed {processed} addresses')
+                fill_restaurant_distances(updated_since=started_at)
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+
+def enqueue_missing_addresses():
+    """Enqueue addresses of unprocessed orders and restaurants which places
+    are missing in the database or have expired."""
+
+    enqueue_addresses(
+        set(
+            Order.objects.filter(
+                status=Order.OrderStatus.UNPROCESSED
+            ).values_list('address', flat=True)
+        ).union(Restaurant.objects.values_list('address', flat=True))
+    )
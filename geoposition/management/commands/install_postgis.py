@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from geoposition.postgis import (
+    has_geography,
+    install_geography,
+    is_postgis_configured,
+)
+
+
+class Command(BaseCommand):
+    help = 'Add PostGIS geography column to places of a migrated database'
+
+    def handle(self, *args, **options):
+        if not is_postgis_configured():
+            raise CommandError('Set GEO_POSTGIS and use PostgreSQL database')
+        if has_geography():
+            self.stdout.write('Geography column is already installed')
+            return
+
+        with transaction.atomic(), connection.schema_editor() as editor:
+            install_geography(editor)
+        self.stdout.write('Geography column installed')
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.10 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+from geoposition.normalization import normalize_address
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    Place = apps.get_model('geoposition', 'Place')
+    places = Place.objects.all()
+
+    for place in places.iterator():
+        place.normalized_address = normalize_address(place.address)
+        place.save(update_fields=['normalized_address'])
+
+
+def remove_duplicate_places(apps, schema_editor):
+    """Keep one place per normalized address, the latest one with known
+    coordinates if there is any."""
+
+    Place = apps.get_model('geoposition', 'Place')
+    places = Place.objects.order_by('normalized_address', 'updated_at')
+
+    kept_places = {}
+    duplicate_ids = []
+    for place in places.iterator():
+        kept_place = kept_places.get(place.normalized_address)
+        if kept_place is None:
+            kept_places[place.normalized_address] = place
+            continue
+        if place.latitude is None and kept_place.latitude is not None:
+            duplicate_ids.append(place.pk)
+            continue
+        duplicate_ids.append(kept_place.pk)
+        kept_places[place.normalized_address] = place
+
+    Place.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoposition', '0004_geocodingtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='normalized_address',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            fill_normalized_addresses, migrations.RunPython.noop
+        ),
+        migrations.RunPython(
+            remove_duplicate_places, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='place',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=200, unique=True, verbose_name='нормализованный адрес'),
+        ),
+    ]
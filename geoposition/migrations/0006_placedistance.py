@@ -0,0 +1,28 @@
+# Generated by Django 3.2.10 on 2026-10-18 18:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoposition', '0005_place_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceDistance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(verbose_name='расстояние, км')),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='distances_to', to='geoposition.place', verbose_name='куда')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='distances_from', to='geoposition.place', verbose_name='откуда')),
+            ],
+            options={
+                'verbose_name': 'расстояние между местами',
+                'verbose_name_plural': 'расстояния между местами',
+                'unique_together': {('origin', 'destination')},
+            },
+        ),
+    ]
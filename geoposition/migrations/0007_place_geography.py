@@ -0,0 +1,30 @@
+# Generated by Django 3.2.10 on 2026-10-18 21:05
+
+from django.db import migrations
+
+from geoposition.postgis import (
+    install_geography,
+    is_postgis_configured,
+    uninstall_geography,
+)
+
+
+def add_geography(apps, schema_editor):
+    if is_postgis_configured(schema_editor.connection):
+        install_geography(schema_editor)
+
+
+def remove_geography(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        uninstall_geography(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoposition', '0006_placedistance'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_geography, remove_geography),
+    ]
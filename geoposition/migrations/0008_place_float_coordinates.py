@@ -0,0 +1,41 @@
+# Generated by Django 3.2.10 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+from geoposition.postgis import (
+    create_sync_trigger,
+    drop_sync_trigger,
+    has_geography,
+)
+
+
+def drop_trigger(apps, schema_editor):
+    if has_geography(schema_editor.connection):
+        drop_sync_trigger(schema_editor)
+
+
+def create_trigger(apps, schema_editor):
+    if has_geography(schema_editor.connection):
+        create_sync_trigger(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoposition', '0007_place_geography'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigger, create_trigger),
+        migrations.AlterField(
+            model_name='place',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='широта'),
+        ),
+        migrations.AlterField(
+            model_name='place',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='долгота'),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -1,5 +1,64 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from geopy import Point
+
+from .normalization import normalize_address
+
+
+class PlaceQuerySet(models.QuerySet):
+    def with_addresses(self, addresses):
+        return self.filter(
+            normalized_address__in={
+                normalize_address(address) for address in addresses
+            }
+        )
+
+    def fresh(self):
+        """Places with coordinates not older than GEOCODE_TTL and places
+        not found by geocoder not older than GEOCODE_NEGATIVE_TTL."""
+
+        now = timezone.now()
+        return self.filter(
+            Q(
+                latitude__isnull=False,
+                updated_at__gte=now - timedelta(seconds=settings.GEOCODE_TTL),
+            )
+            | Q(
+                latitude__isnull=True,
+                updated_at__gte=now
+                - timedelta(seconds=settings.GEOCODE_NEGATIVE_TTL),
+            )
+        )
 
+    def get_places(self, addresses):
+        """Return places matching addresses.
+
+        Addresses are matched by their normalized form.
+
+        Args:
+            addresses: addresses to look up
+
+        Returns:
+            dictionary mapping addresses to places
+        """
+
+        addresses = set(addresses)
+        places = {
+            place.normalized_address: place
+            for place in self.with_addresses(addresses)
+        }
+
+        return {
+            address: places[normalize_address(address)]
+            for address in addresses
+            if normalize_address(address) in places
+        }
 
 class Place(models.Model):
     address = models.CharField(
@@ -8,18 +67,21 @@ class Place(models.Model):
         unique=True,
     )
 
-    latitude = models.DecimalField(
+    normalized_address = models.CharField(
+        'нормализованный адрес',
+        max_length=200,
+        unique=True,
+        editable=False,
+    )
+
+    latitude = models.FloatField(
         'широта',
-        max_digits=6,
-        decimal_places=3,
         null=True,
         blank=True,
     )
 
-    longitude = models.DecimalField(
+    longitude = models.FloatField(
         'долгота',
-        max_digits=6,
-        decimal_places=3,
         null=True,
         blank=True,
     )
@@ -29,9 +91,90 @@ class Place(models.Model):
         auto_now=True,
     )
 
+    objects = PlaceQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'место с координатами'
         verbose_name_plural = 'места с координатами'
 
     def __str__(self):
         return self.address
+
+    def clean(self):
+        duplicates = Place.objects.filter(
+            normalized_address=normalize_address(self.address)
+        ).exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError(
+                {'address': 'Место с таким адресом уже существует.'}
+            )
+
+    @cached_property
+    def point(self):
+        """Coordinates as geopy point, parsed once per place."""
+
+        if self.latitude is None or self.longitude is None:
+            return None
+        return Point(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+        PlaceDistance.objects.filter(
+            Q(origin=self) | Q(destination=self)
+        ).delete()
+
+
+class GeocodingTask(models.Model):
+    address = models.CharField(
+        'адрес',
+        max_length=100,
+        unique=True,
+    )
+
+    created_at = models.DateTimeField(
+        'дата постановки в очередь',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    scheduled_at = models.DateTimeField(
+        'дата следующей попытки',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    attempts = models.PositiveIntegerField('число попыток', default=0)
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
+
+    def __str__(self):
+        return self.address
+
+
+class PlaceDistance(models.Model):
+    origin = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='distances_from',
+        verbose_name='откуда',
+    )
+
+    destination = models.ForeignKey(
+        Place,
+        on_delete=models.CASCADE,
+        related_name='distances_to',
+        verbose_name='куда',
+    )
+
+    distance = models.FloatField('расстояние, км')
+
+    class Meta:
+        verbose_name = 'расстояние между местами'
+        verbose_name_plural = 'расстояния между местами'
+        unique_together = [['origin', 'destination']]
+
+    def __str__(self):
+        return f'{self.origin} - {self.destination}: {self.distance:.3f} км'
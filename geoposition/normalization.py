@@ -0,0 +1,48 @@
+import re
+
+
+ABBREVIATIONS = {
+    'г': 'город',
+    'гор': 'город',
+    'обл': 'область',
+    'р-н': 'район',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'д': 'дом',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+PUNCTUATION = re.compile(r'[^\w\s-]+|(?<!\w)-|-(?!\w)')
+
+
+def normalize_address(address):
+    """Return canonical key of the address.
+
+    Letter case, ё, punctuation and whitespace are folded and common
+    abbreviations are expanded, so "Москва, ул. Тверская, д.1" and
+    "москва  улица тверская дом 1" get the same key.
+
+    Args:
+        address: address as typed by a user
+
+    Returns:
+        normalized address
+    """
+
+    address = address.casefold().replace('ё', 'е')
+    words = PUNCTUATION.sub(' ', address).split()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
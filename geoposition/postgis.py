@@ -0,0 +1,154 @@
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from django.db import connection, connections
+
+
+CREATE_TRIGGER_SQL = '''
+    CREATE TRIGGER geoposition_place_sync_geog
+    BEFORE INSERT OR UPDATE OF latitude, longitude ON geoposition_place
+    FOR EACH ROW EXECUTE PROCEDURE geoposition_place_sync_geog()
+'''
+
+DROP_TRIGGER_SQL = (
+    'DROP TRIGGER IF EXISTS geoposition_place_sync_geog ON geoposition_place'
+)
+
+INSTALL_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS postgis',
+    'ALTER TABLE geoposition_place ADD COLUMN geog geography(Point, 4326)',
+    '''
+    UPDATE geoposition_place
+    SET geog = ST_SetSRID(
+        ST_MakePoint(longitude::float8, latitude::float8), 4326
+    )::geography
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''',
+    '''
+    CREATE INDEX geoposition_place_geog_idx
+    ON geoposition_place USING GIST (geog)
+    ''',
+    '''
+    CREATE FUNCTION geoposition_place_sync_geog() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.latitude IS NULL OR NEW.longitude IS NULL THEN
+            NEW.geog := NULL;
+        ELSE
+            NEW.geog := ST_SetSRID(
+                ST_MakePoint(NEW.longitude::float8, NEW.latitude::float8),
+                4326
+            )::geography;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    CREATE_TRIGGER_SQL,
+]
+
+UNINSTALL_SQL = [
+    DROP_TRIGGER_SQL,
+    'DROP FUNCTION IF EXISTS geoposition_place_sync_geog()',
+    'ALTER TABLE geoposition_place DROP COLUMN IF EXISTS geog',
+]
+
+# Whether the geography column is installed, by database connection
+geography_installed = WeakKeyDictionary()
+
+
+def is_postgis_configured(db_connection=connection):
+    """Check whether PostGIS is switched on for the database."""
+
+    return settings.GEO_POSTGIS and db_connection.vendor == 'postgresql'
+
+
+def is_postgis_enabled(db_connection=connection):
+    """Check whether places have the geography column to query.
+
+    Presence of the column is checked once per database connection, so
+    processes started before the column is installed keep calculating
+    distances with geopy until restarted.
+    """
+
+    if not is_postgis_configured(db_connection):
+        return False
+
+    db_connection = connections[db_connection.alias]
+    if db_connection not in geography_installed:
+        geography_installed[db_connection] = has_geography(db_connection)
+    return geography_installed[db_connection]
+
+
+def has_geography(db_connection=connection):
+    """Check whether the geography column is installed."""
+
+    if db_connection.vendor != 'postgresql':
+        return False
+
+    with db_connection.cursor() as cursor:
+        columns = db_connection.introspection.get_table_description(
+            cursor, 'geoposition_place'
+        )
+    return any(column.name == 'geog' for column in columns)
+
+
+def install_geography(schema_editor):
+    """Add geography column kept in sync with coordinates of places.
+
+    Column is indexed with GiST for spatial queries.
+    """
+
+    for sql in INSTALL_SQL:
+        schema_editor.execute(sql)
+    geography_installed.pop(connections[schema_editor.connection.alias], None)
+
+
+def uninstall_geography(schema_editor):
+    for sql in UNINSTALL_SQL:
+        schema_editor.execute(sql)
+    geography_installed.pop(connections[schema_editor.connection.alias], None)
+
+
+def drop_sync_trigger(schema_editor):
+    """Drop trigger, PostgreSQL can't alter columns it depends on."""
+
+    schema_editor.execute(DROP_TRIGGER_SQL)
+
+
+def create_sync_trigger(schema_editor):
+    schema_editor.execute(CREATE_TRIGGER_SQL)
+
+
+def calculate_distances(place_id_pairs):
+    """Calculate geodesic distances between pairs of places in database.
+
+    Args:
+        place_id_pairs: list of (origin id, destination id) pairs
+
+    Returns:
+        dictionary mapping (origin id, destination id) pairs to distances
+        in km
+    """
+
+    if not place_id_pairs:
+        return {}
+
+    origin_ids, destination_ids = zip(*place_id_pairs)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT origin.id, destination.id,
+                ST_Distance(origin.geog, destination.geog) / 1000
+            FROM unnest(%s::bigint[], %s::bigint[])
+                AS pair(origin_id, destination_id)
+            JOIN geoposition_place AS origin ON origin.id = pair.origin_id
+            JOIN geoposition_place AS destination
+                ON destination.id = pair.destination_id
+            WHERE origin.geog IS NOT NULL AND destination.geog IS NOT NULL
+            ''',
+            [list(origin_ids), list(destination_ids)],
+        )
+        return {
+            (origin_id, destination_id): km
+            for origin_id, destination_id, km in cursor.fetchall()
+        }
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from foodcartapp.models import (
+    Order,
+    OrderPosition,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .handle_coordinates import (
+    enqueue_addresses,
+    fetch_coordinates_batch,
+    process_geocoding_queue,
+    save_places,
+    TokenBucket,
+)
+from .management.commands.geocode_places import fill_restaurant_distances
+from .models import GeocodingTask, Place, PlaceDistance
+
+
+class StubGeocoder(ThreadingHTTPServer):
+    """Local geocoder answering like Yandex API after a delay.
+
+    Addresses listed in `failing_addresses` get 503 on their first request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.1, failing_addresses=()):
+        super().__init__(('127.0.0.1', 0), StubGeocoderHandler)
+        self.delay = delay
+        self.failing_addresses = set(failing_addresses)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}/'
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+
+        with server.lock:
+            server.requests.append((time.monotonic(), address))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            failing = address in server.failing_addresses
+            server.failing_addresses.discard(address)
+
+        time.sleep(server.delay)
+
+        with server.lock:
+            server.in_flight -= 1
+
+        if failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = json.dumps(
+            {
+                'response': {
+                    'GeoObjectCollection': {
+                        'featureMember': [
+                            {
+                                'GeoObject': {
+                                    'Point': {'pos': '37.617698 55.755864'},
+                                },
+                            },
+                        ],
+                    },
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_rate_must_be_positive(self):
+        for rate in (0, -1):
+            with self.subTest(rate=rate), self.assertRaises(ValueError):
+                TokenBucket(rate)
+
+
+class FetchCoordinatesBatchTest(SimpleTestCase):
+    def start_geocoder(self, **params):
+        geocoder = StubGeocoder(**params)
+        threading.Thread(target=geocoder.serve_forever, daemon=True).start()
+        self.addCleanup(geocoder.server_close)
+        self.addCleanup(geocoder.shutdown)
+        return geocoder
+
+    def fetch(self, geocoder, addresses, rate_limiter):
+        with override_settings(
+            GEOCODER_URL=geocoder.url,
+            GEOCODER_CONCURRENCY=4,
+            GEOCODER_BACKOFF=0,
+        ):
+            return fetch_coordinates_batch('key', addresses, rate_limiter)
+
+    def test_requests_are_concurrent_and_bounded(self):
+        geocoder = self.start_geocoder(delay=0.2)
+        addresses = [f'Москва, Тверская {number}' for number in range(12)]
+
+        coordinates = self.fetch(geocoder, addresses, TokenBucket(1000))
+
+        self.assertEqual(
+            coordinates,
+            {
+                address: {'latitude': 55.755864, 'longitude': 37.617698}
+                for address in addresses
+            },
+        )
+        self.assertEqual(geocoder.max_in_flight, 4)
+
+    def test_requests_are_rate_limited(self):
+        geocoder = self.start_geocoder(delay=0)
+        addresses = [f'Москва, Тверская {number}' for number in range(6)]
+
+        self.fetch(geocoder, addresses, TokenBucket(20, capacity=1))
+
+        started = [started_at for started_at, _ in geocoder.requests]
+        # 6 requests at 20 per second with no burst take at least 0.25 s
+        self.assertGreaterEqual(max(started) - min(started), 0.24)
+
+    def test_failed_requests_are_retried(self):
+        geocoder = self.start_geocoder(
+            delay=0, failing_addresses=['Москва, Арбат 1']
+        )
+
+        coordinates = self.fetch(
+            geocoder, ['Москва, Арбат 1'], TokenBucket(1000)
+        )
+
+        self.assertEqual(
+            coordinates,
+            {
+                'Москва, Арбат 1': {
+                    'latitude': 55.755864,
+                    'longitude': 37.617698,
+                },
+            },
+        )
+        self.assertEqual(len(geocoder.requests), 2)
+
+
+class ProcessGeocodingQueueTest(TestCase):
+    def test_tasks_are_claimed_while_geocoded(self):
+        GeocodingTask.objects.bulk_create(
+            [
+                GeocodingTask(address='Москва, Тверская 1'),
+                GeocodingTask(address='Москва, Арбат 1'),
+            ]
+        )
+
+        def fetch_coordinates_batch(apikey, addresses):
+            now = timezone.now()
+            self.assertFalse(
+                GeocodingTask.objects.filter(scheduled_at__lte=now).exists()
+            )
+            return {
+                'Москва, Тверская 1': {'latitude': 55.7, 'longitude': 37.6},
+            }
+
+        with mock.patch(
+            'geoposition.handle_coordinates.fetch_coordinates_batch',
+            fetch_coordinates_batch,
+        ):
+            self.assertEqual(process_geocoding_queue('key'), 2)
+
+        self.assertQuerysetEqual(
+            Place.objects.values_list('address', flat=True),
+            ['Москва, Тверская 1'],
+        )
+        failed_task = GeocodingTask.objects.get()
+        self.assertEqual(failed_task.address, 'Москва, Арбат 1')
+        self.assertEqual(failed_task.attempts, 1)
+        self.assertGreater(failed_task.scheduled_at, timezone.now())
+
+
+@override_settings(GEOCODE_TTL=60 * 60, GEOCODE_NEGATIVE_TTL=60)
+class PlaceFreshnessTest(TestCase):
+    def create_place(self, address, latitude, longitude, age):
+        place = Place.objects.create(
+            address=address, latitude=latitude, longitude=longitude
+        )
+        Place.objects.filter(pk=place.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=age)
+        )
+
+    def test_places_expire_after_ttl(self):
+        self.create_place('Москва, Тверская 1', 55.7, 37.6, age=30 * 60)
+        self.create_place('Москва, Тверская 2', 55.7, 37.6, age=2 * 60 * 60)
+
+        self.assertQuerysetEqual(
+            Place.objects.fresh().values_list('address', flat=True),
+            ['Москва, Тверская 1'],
+        )
+
+    def test_not_found_places_expire_after_negative_ttl(self):
+        self.create_place('Москва, Арбат 1', None, None, age=30)
+        self.create_place('Москва, Арбат 2', None, None, age=30 * 60)
+
+        self.assertQuerysetEqual(
+            Place.objects.fresh().values_list('address', flat=True),
+            ['Москва, Арбат 1'],
+        )
+
+    def test_expired_places_are_enqueued(self):
+        self.create_place('Москва, Тверская 1', 55.7, 37.6, age=30 * 60)
+        self.create_place('Москва, Тверская 2', 55.7, 37.6, age=2 * 60 * 60)
+        self.create_place('Москва, Арбат 1', None, None, age=30)
+        self.create_place('Москва, Арбат 2', None, None, age=30 * 60)
+
+        enqueue_addresses(
+            [
+                'москва тверская 1',
+                'москва тверская 2',
+                'Москва, Арбат 1',
+                'Москва, Арбат 2',
+                'Москва, Арбат 3',
+            ]
+        )
+
+        self.assertQuerysetEqual(
+            GeocodingTask.objects.order_by('address').values_list(
+                'address', flat=True
+            ),
+            ['Москва, Арбат 2', 'Москва, Арбат 3', 'москва тверская 2'],
+        )
+
+
+class SavePlacesTest(TestCase):
+    def test_places_are_upserted_by_normalized_address(self):
+        Place.objects.create(address='Москва, ул. Тверская, д. 1')
+
+        save_places(
+            {
+                'москва улица тверская дом 1': {
+                    'latitude': 55.7,
+                    'longitude': 37.6,
+                },
+                'Москва, Арбат 1': {
+                    'latitude': 55.749511,
+                    'longitude': 37.590415,
+                },
+            }
+        )
+
+        self.assertQuerysetEqual(
+            Place.objects.order_by('address').values_list(
+                'address', 'latitude', 'longitude'
+            ),
+            [
+                ('Москва, Арбат 1', 55.749511, 37.590415),
+                ('Москва, ул. Тверская, д. 1', 55.7, 37.6),
+            ],
+            transform=tuple,
+        )
+
+    def test_found_coordinates_win_over_not_found_variant(self):
+        save_places(
+            {
+                'Москва, Тверская 1': {'latitude': 55.7, 'longitude': 37.6},
+                'москва тверская 1': {'latitude': None, 'longitude': None},
+            }
+        )
+
+        place = Place.objects.get()
+        self.assertEqual(place.address, 'Москва, Тверская 1')
+        self.assertEqual(place.latitude, 55.7)
+
+    def test_address_variants_are_unique(self):
+        Place.objects.create(address='Москва, Тверская 1')
+
+        with self.assertRaises(ValidationError):
+            Place(address='москва  тверская 1').full_clean()
+
+
+class FillRestaurantDistancesTest(TestCase):
+    def create_restaurant(self, name, address, products):
+        restaurant = Restaurant.objects.create(name=name, address=address)
+        for product in products:
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product
+            )
+        return restaurant
+
+    def create_order(self, address, products):
+        order = Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address=address,
+        )
+        for product in products:
+            OrderPosition.objects.create(
+                order=order, product=product, quantity=1, price=product.price
+            )
+        return order
+
+    def test_distances_are_filled_for_matching_restaurants_only(self):
+        burger = Product.objects.create(
+            name='Чизбургер', price=100, image='burger.png'
+        )
+        fries = Product.objects.create(
+            name='Картофель фри', price=50, image='fries.png'
+        )
+        self.create_restaurant('Бургерная', 'Москва, Тверская 1', [burger])
+        self.create_restaurant('Закусочная', 'Москва, Арбат 1', [fries])
+        self.create_restaurant(
+            'Star Burger', 'Москва, Ленинский 1', [burger, fries]
+        )
+        self.create_order('Москва, Тверская 10', [burger])
+        self.create_order('Москва, Арбат 10', [burger, fries])
+
+        started_at = timezone.now()
+        save_places(
+            {
+                'Москва, Тверская 1': {'latitude': 55.76, 'longitude': 37.6},
+                'Москва, Арбат 1': {'latitude': 55.75, 'longitude': 37.59},
+                'Москва, Ленинский 1': {'latitude': 55.7, 'longitude': 37.58},
+                'Москва, Тверская 10': {'latitude': 55.77, 'longitude': 37.6},
+                'Москва, Арбат 10': {'latitude': None, 'longitude': None},
+            }
+        )
+
+        fill_restaurant_distances(updated_since=started_at)
+
+        self.assertQuerysetEqual(
+            PlaceDistance.objects.order_by('destination__address'),
+            [
+                ('Москва, Тверская 10', 'Москва, Ленинский 1'),
+                ('Москва, Тверская 10', 'Москва, Тверская 1'),
+            ],
+            transform=lambda place_distance: (
+                place_distance.origin.address,
+                place_distance.destination.address,
+            ),
+        )
+        self.assertAlmostEqual(
+            PlaceDistance.objects.get(
+                destination__address='Москва, Тверская 1'
+            ).distance,
+            1.11,
+            places=2,
+        )
+
+        fill_restaurant_distances(updated_since=timezone.now())
+        self.assertEqual(PlaceDistance.objects.count(), 2)
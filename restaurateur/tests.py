@@ -1,3 +1,142 @@
-from django.test import TestCase
+import json
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from foodcartapp.feed import OrdersCursor
+from foodcartapp.models import Order
+
+
+@override_settings(
+    ORDERS_FEED_POLL_INTERVAL=0.01,
+    ORDERS_FEED_POLL_TIMEOUT=0.05,
+    ORDERS_FEED_MAX_DURATION=0.05,
+)
+class OrdersFeedViewTest(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+        self.slots = threading.BoundedSemaphore(1)
+        for target in (
+            'foodcartapp.feed.feed_connections',
+            'restaurateur.views.feed_connections',
+        ):
+            patcher = mock.patch(target, self.slots)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_order(self, address):
+        return Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address=address,
+        )
+
+    def get_page_cursor(self):
+        response = self.client.get('/manager/orders/')
+        cursor = response.context['feed_cursor']
+        self.assertIn(f"'{cursor}'", response.content.decode())
+        return cursor
+
+    def poll(self, cursor):
+        return self.client.get(
+            '/manager/orders/feed/', {'mode': 'poll', 'cursor': cursor}
+        )
+
+    def test_feed_resumes_from_page_cursor(self):
+        self.create_order('Москва, Тверская 1')
+        cursor = self.get_page_cursor()
+        order = self.create_order('Москва, Тверская 2')
+
+        response = self.poll(cursor)
+
+        self.assertEqual(response.status_code, 200)
+        changes = response.json()
+        self.assertEqual(
+            [change['id'] for change in changes['orders']], [order.pk]
+        )
+        self.assertNotIn('Retry-After', response)
+
+        response = self.poll(changes['cursor'])
+        self.assertEqual(response.json()['orders'], [])
+
+    def test_stream_sends_changes_and_frees_connection(self):
+        cursor = self.get_page_cursor()
+        order = self.create_order('Москва, Тверская 1')
+
+        response = self.client.get('/manager/orders/feed/', {'cursor': cursor})
+        self.assertFalse(self.slots.acquire(blocking=False))
+
+        events = b''.join(response.streaming_content).decode()
+        response.close()
+
+        self.assertIn('event: order', events)
+        self.assertIn(f'"id": {order.pk}', events)
+        last_event_id = [
+            line[len('id: '):]
+            for line in events.splitlines()
+            if line.startswith('id: ')
+        ][-1]
+        self.assertEqual(
+            OrdersCursor.decode(last_event_id).seen,
+            {order.pk: Order.objects.get().updated_at},
+        )
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+    def test_connections_over_limit_are_not_held(self):
+        cursor = self.get_page_cursor()
+        self.slots.acquire()
+
+        response = self.client.get('/manager/orders/feed/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 503)
+
+        order = self.create_order('Москва, Тверская 1')
+        response = self.poll(cursor)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(
+            [change['id'] for change in response.json()['orders']],
+            [order.pk],
+        )
+
+
+class OrdersExportViewTest(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+        self.order = Order.objects.create(
+            first_name='Иван',
+            last_name='Иванов',
+            contact_phone='+79291000000',
+            address='Москва, Тверская 1',
+        )
+
+    def test_orders_are_streamed_as_attachment(self):
+        response = self.client.get(
+            '/manager/orders/export/', {'format': 'ndjson'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="orders.ndjson"',
+        )
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['id'] for line in lines], [self.order.pk]
+        )
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(
+            '/manager/orders/export/', {'format': 'xml', 'status': 'LOST'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'format', 'status'})
@@ -15,6 +15,26 @@ urlpatterns = [
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
 
+    path('orders/feed/', views.view_orders_feed, name="view_orders_feed"),
+
+    path(
+        'orders/export/',
+        views.view_orders_export,
+        name="view_orders_export",
+    ),
+
+    path(
+        'orders/<int:order_id>/restaurants/',
+        views.view_order_restaurants,
+        name="view_order_restaurants",
+    ),
+
+    path(
+        'geocoding-queue/',
+        views.view_geocoding_queue,
+        name="view_geocoding_queue",
+    ),
+
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
 ]
@@ -1,16 +1,36 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
 from django import forms
 from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
+from django.core.paginator import Paginator
+from django.http import (
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.views import View
 
+from foodcartapp.caching import availability_matrix
+from foodcartapp.export import EXPORT_FORMATS, export_orders, get_day_start
+from foodcartapp.feed import (
+    FeedConnection,
+    feed_connections,
+    get_orders_changes,
+    OrdersCursor,
+    serialize_order_change,
+)
 from foodcartapp.models import Order, Product, Restaurant, RestaurantMenuItem
 from geoposition.handle_coordinates import (
-    fill_db_with_missing_places,
-    get_places_missing_in_db,
+    enqueue_addresses,
+    get_geocoding_queue_stats,
 )
 
 
@@ -73,33 +93,39 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
+def get_availability_matrix():
+    """Return ids of restaurants where products are available.
+
+    Returns:
+        dictionary mapping product ids to sets of restaurant ids, products
+        not available anywhere are omitted
+    """
+
+    matrix = defaultdict(set)
+    for product_id, restaurant_id in RestaurantMenuItem.objects.filter(
+        availability=True
+    ).values_list('product', 'restaurant'):
+        matrix[product_id].add(restaurant_id)
+    return dict(matrix)
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
-
-    default_availability = {restaurant.id: False for restaurant in restaurants}
-    products_with_restaurants = []
-    for product in products:
+    products = Product.objects.select_related('category').order_by('pk')
 
-        availability = {
-            **default_availability,
-            **{
-                item.restaurant_id: item.availability
-                for item in product.menu_items.all()
-            },
-        }
-        orderer_availability = [
-            availability[restaurant.id] for restaurant in restaurants
-        ]
-
-        products_with_restaurants.append((product, orderer_availability))
+    page = Paginator(products, settings.PRODUCTS_PER_PAGE).get_page(
+        request.GET.get('page')
+    )
+    matrix = availability_matrix.get(get_availability_matrix)
+    for product in page:
+        product.available_restaurants = matrix.get(product.id, set())
 
     return render(
         request,
         template_name="products_list.html",
         context={
-            'products_with_restaurants': products_with_restaurants,
+            'products': page,
             'restaurants': restaurants,
         },
     )
@@ -116,31 +142,222 @@ def view_restaurants(request):
     )
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
-    apikey = settings.YANDEX_API_TOKEN
+class OrdersFilter(forms.Form):
+    registered_from = forms.DateField(
+        label='Зарегистрирован с',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    registered_to = forms.DateField(
+        label='по',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    payment_method = forms.ChoiceField(
+        label='Способ оплаты',
+        required=False,
+        choices=[('', 'Любой'), *Order.OrderPaymentMethod.choices],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    restaurant = forms.ChoiceField(
+        label='Ресторан',
+        required=False,
+        choices=[
+            ('', 'Любой'),
+            ('assigned', 'Назначен'),
+            ('unassigned', 'Не назначен'),
+        ],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+    def filter_orders(self, orders):
+        filters = self.cleaned_data
+        registered_from = filters['registered_from']
+        registered_to = filters['registered_to']
+
+        orders = orders.registered_between(
+            start=registered_from and get_day_start(registered_from),
+            end=registered_to
+            and get_day_start(registered_to + timedelta(days=1)),
+        )
+        if filters['payment_method']:
+            orders = orders.filter(payment_method=filters['payment_method'])
+        if filters['restaurant']:
+            orders = orders.filter(
+                restaurant__isnull=filters['restaurant'] == 'unassigned'
+            )
+        return orders
+
+
+class OrdersExportFilter(OrdersFilter):
+    status = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Любой'), *Order.OrderStatus.choices],
+    )
+    format = forms.ChoiceField(
+        required=False,
+        choices=[
+            (export_format, export_format) for export_format in EXPORT_FORMATS
+        ],
+    )
 
-    available_menu_items = RestaurantMenuItem.objects.select_related(
-        'restaurant',
-        'product',
-    ).filter(availability=True)
+    def filter_orders(self, orders):
+        orders = super().filter_orders(orders)
+        if self.cleaned_data['status']:
+            orders = orders.filter(status=self.cleaned_data['status'])
+        return orders
 
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders(request):
+    # Taken before the orders are queried, so the feed resumes from the
+    # state the page shows
+    feed_cursor = OrdersCursor.current()
     orders = (
-        Order.objects.prefetch_related('order_positions__product')
-        .filter(status='UNPROCESSED')
+        Order.objects.unprocessed()
         .with_total_prices()
+        .order_by('registered_at', 'pk')
     )
 
-    missing_places = get_places_missing_in_db(orders, available_menu_items)
-    if missing_places:
-        fill_db_with_missing_places(missing_places, apikey)
+    filters = OrdersFilter(request.GET)
+    if filters.is_valid():
+        orders = filters.filter_orders(orders)
+
+    page = Paginator(orders, settings.ORDERS_PER_PAGE).get_page(
+        request.GET.get('page')
+    )
+    enqueue_addresses({order.address for order in page})
 
-    orders.add_restaurants_with_distances(available_menu_items)
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
 
     return render(
         request,
         template_name='order_items.html',
         context={
-            'order_items': orders,
+            'order_items': page,
+            'filters': filters,
+            'query_string': query_params.urlencode(),
+            'feed_cursor': feed_cursor.encode(),
+        },
+    )
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders_export(request):
+    """Stream orders with positions as CSV or NDJSON.
+
+    Accepts filters of the orders page plus `status` and `format` query
+    parameters.
+    """
+
+    filters = OrdersExportFilter(request.GET)
+    if not filters.is_valid():
+        return JsonResponse(
+            filters.errors,
+            status=400,
+            json_dumps_params={'ensure_ascii': False},
+        )
+
+    export_format = filters.cleaned_data['format'] or 'csv'
+    content_type, chunks = export_orders(
+        filters.filter_orders(Order.objects.all()), export_format
+    )
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="orders.{export_format}"'
+    )
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_restaurants(request, order_id):
+    orders = Order.objects.filter(pk=order_id)
+    if not orders:
+        raise Http404('Заказ не найден')
+
+    enqueue_addresses({order.address for order in orders})
+
+    [order] = orders.add_restaurant_candidates(
+        limit=settings.RESTAURANTS_PER_ORDER,
+    )
+
+    return JsonResponse(
+        {
+            'restaurants': [
+                {
+                    'id': candidate.restaurant.id,
+                    'name': candidate.restaurant.name,
+                    'distance': candidate.distance,
+                    'eta': candidate.eta,
+                    'unresolved': candidate.unresolved,
+                }
+                for candidate in order.restaurant_candidates
+            ],
         },
+        json_dumps_params={'ensure_ascii': False},
     )
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders_feed(request):
+    """Stream orders changes as server-sent events.
+
+    With `mode=poll` query parameter works as a long-polling endpoint instead:
+    waits up to ORDERS_FEED_POLL_TIMEOUT seconds for changes and returns
+    them as JSON together with a cursor for the next request.
+
+    Open streams and waiting long-poll requests are limited by
+    ORDERS_FEED_MAX_CONNECTIONS per process. Over the limit streams are
+    refused with 503, so clients fall back to polling, and polls return
+    at once with a Retry-After header.
+    """
+
+    cursor = OrdersCursor.decode(
+        request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    ) or OrdersCursor.current()
+
+    connected = feed_connections.acquire(blocking=False)
+
+    if request.GET.get('mode') != 'poll':
+        if not connected:
+            response = HttpResponse(status=503)
+            response['Retry-After'] = settings.ORDERS_FEED_RETRY_MS // 1000
+            return response
+        response = StreamingHttpResponse(
+            FeedConnection(cursor),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    try:
+        started_at = time.monotonic()
+        orders = get_orders_changes(cursor)
+        while connected and not orders and (
+            time.monotonic() - started_at
+            < settings.ORDERS_FEED_POLL_TIMEOUT
+        ):
+            time.sleep(settings.ORDERS_FEED_POLL_INTERVAL)
+            orders = get_orders_changes(cursor)
+    finally:
+        if connected:
+            feed_connections.release()
+
+    response = JsonResponse(
+        {
+            'orders': [serialize_order_change(order) for order in orders],
+            'cursor': cursor.encode(),
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+    if not connected:
+        response['Retry-After'] = settings.ORDERS_FEED_RETRY_MS // 1000
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_geocoding_queue(request):
+    return JsonResponse(get_geocoding_queue_stats())
@@ -19,6 +19,35 @@ ALLOWED_HOSTS = env.str('ALLOWED_HOSTS', '127.0.0.1 localhost').split()
 
 YANDEX_API_TOKEN = env.str('YANDEX_API_TOKEN', '11111')
 
+GEOCODER_URL = env.str('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODER_CONCURRENCY = env.int('GEOCODER_CONCURRENCY', 4)
+GEOCODER_RATE_LIMIT = env.float('GEOCODER_RATE_LIMIT', 10)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 3)
+GEOCODER_BACKOFF = env.float('GEOCODER_BACKOFF', 0.5)
+
+GEOCODING_MAX_ATTEMPTS = env.int('GEOCODING_MAX_ATTEMPTS', 5)
+GEOCODING_RETRY_DELAY = env.int('GEOCODING_RETRY_DELAY', 30)
+GEOCODING_CLAIM_TIMEOUT = env.int('GEOCODING_CLAIM_TIMEOUT', 300)
+GEOCODE_TTL = env.int('GEOCODE_TTL', 90 * 24 * 60 * 60)
+GEOCODE_NEGATIVE_TTL = env.int('GEOCODE_NEGATIVE_TTL', 24 * 60 * 60)
+GEO_POSTGIS = env.bool('GEO_POSTGIS', False)
+
+RESTAURANTS_PER_ORDER = env.int('RESTAURANTS_PER_ORDER', 5)
+DELIVERY_SPEED = env.float('DELIVERY_SPEED', 20)  # km/h
+RESTAURANT_MAX_OPEN_ORDERS = env.int('RESTAURANT_MAX_OPEN_ORDERS', 10)
+ORDERS_PER_PAGE = env.int('ORDERS_PER_PAGE', 50)
+PRODUCTS_PER_PAGE = env.int('PRODUCTS_PER_PAGE', 50)
+
+ORDERS_FEED_POLL_INTERVAL = env.float('ORDERS_FEED_POLL_INTERVAL', 2)
+ORDERS_FEED_POLL_TIMEOUT = env.float('ORDERS_FEED_POLL_TIMEOUT', 25)
+ORDERS_FEED_MAX_DURATION = env.float('ORDERS_FEED_MAX_DURATION', 60)
+ORDERS_FEED_MAX_CONNECTIONS = env.int('ORDERS_FEED_MAX_CONNECTIONS', 8)
+ORDERS_FEED_OVERLAP = env.float('ORDERS_FEED_OVERLAP', 10)
+ORDERS_FEED_HEARTBEAT = env.float('ORDERS_FEED_HEARTBEAT', 15)
+ORDERS_FEED_RETRY_MS = env.int('ORDERS_FEED_RETRY_MS', 3000)
+ORDERS_FEED_BATCH_SIZE = env.int('ORDERS_FEED_BATCH_SIZE', 100)
+
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
     'geoposition.apps.GeopositionConfig',
@@ -83,6 +112,16 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': env.str(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': env.str('CACHE_LOCATION', ''),
+    },
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -123,6 +162,10 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+STATICFILES_STORAGE = env.str(
+    'STATICFILES_STORAGE',
+    'django.contrib.staticfiles.storage.StaticFilesStorage',
+)
 
 INTERNAL_IPS = ['127.0.0.1']
 
@@ -0,0 +1,74 @@
+import gzip
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css',
+    '.js',
+    '.map',
+    '.json',
+    '.svg',
+    '.html',
+    '.txt',
+    '.xml',
+    '.ico',
+)
+MIN_COMPRESSIBLE_SIZE = 256
+
+
+def compress_gzip(content):
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def compress_brotli(content):
+    return brotli.compress(content, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage saving precompressed copies of text files.
+
+    Next to every collected text file `.br` and `.gz` copies are saved, so
+    a web server can send them as is (e.g. nginx `brotli_static` and
+    `gzip_static`). Copies which are not smaller than the original are
+    skipped.
+    """
+
+    compressors = [('br', compress_brotli), ('gz', compress_gzip)]
+
+    def post_process(self, paths, dry_run=False, **options):
+        # Files are processed in several passes, only the last hashed name
+        # of a file is kept
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run=dry_run, **options
+        ):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names[name] = hashed_name
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for name, hashed_name in sorted(hashed_names.items()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.save_compressed(name)
+                self.save_compressed(hashed_name)
+
+    def save_compressed(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESSIBLE_SIZE:
+            return
+
+        for extension, compress in self.compressors:
+            compressed = compress(content)
+            if len(compressed) >= len(content):
+                continue
+
+            compressed_name = f'{name}.{extension}'
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))